@@ -1,10 +1,41 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import mysql.connector
 from mysql.connector import Error
+import csv
+import functools
+import gzip
+import asyncio
 import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
 import openpyxl
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
+from openpyxl.worksheet.datavalidation import DataValidation
+from pandas.api.types import union_categoricals
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from math import ceil
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# Errors raised by either storage backend
+DB_ERRORS = (Error, sqlite3.Error)
 
 # Page configuration
 st.set_page_config(
@@ -46,293 +77,3221 @@ st.markdown("""
         color: #721c24;
         margin: 10px 0;
     }
-</style>
-""", unsafe_allow_html=True)
+</style>
+""", unsafe_allow_html=True)
+
+# Storage backend: 'mysql' (server configured by DB_CONFIG) or 'sqlite' (embedded file, SQLITE_CONFIG)
+STORAGE_BACKEND = 'mysql'
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'phpmyadmin',
+    'password': '123',  # Change this to your MySQL password
+    'database': 'test'
+}
+
+# Embedded SQLite settings (used when STORAGE_BACKEND = 'sqlite')
+SQLITE_CONFIG = {
+    'path': 'courses.db',       # Database file, created on first use
+    'busy_timeout': 5,          # Seconds a writer waits for another writer's lock
+    'synchronous': 'NORMAL'     # WAL + NORMAL: no corruption on crash, may lose the last commits on power loss
+}
+
+# Connection pool configuration (shared by every session of this server process)
+POOL_CONFIG = {
+    'pool_size': 5,                 # Maximum number of open connections
+    'checkout_timeout': 10,         # Seconds to wait for a free connection
+    'health_check_interval': 30     # Ping connections that were idle longer than this (seconds)
+}
+
+# Read replicas of the primary: each entry overrides DB_CONFIG keys, e.g. {'host': 'replica-1'}
+# (with SQLite, {'path': ...} names a copy of the file: a local stand-in for testing the routing).
+# MySQL lag checks need the REPLICATION CLIENT privilege; a replica that cannot be checked is not used
+REPLICA_CONFIGS = []
+
+# Read routing across REPLICA_CONFIGS (each replica gets its own pool sized by POOL_CONFIG)
+REPLICA_ROUTING = {
+    'max_lag': 5,           # Seconds behind the primary before a replica is skipped
+    'status_interval': 1    # Seconds between lag/version checks of each replica
+}
+
+# Async data layer (reads and imports get separate lanes; keep their sum within pool_size).
+# Interactive writes (edits, deletes) bypass the lanes so they never queue behind an import
+ASYNC_CONFIG = {
+    'read_concurrency': 4,      # Reads running at once across all sessions
+    'write_concurrency': 1      # Imports writing at once
+}
+
+# Change log: every write is also recorded in tbl_course_changes
+CHANGE_LOG_CONFIG = {
+    'poll_interval': 2,     # Seconds between checks for changes made by other server processes
+    'max_delta': 5000,      # Bigger backlogs reload the catalogue instead of applying the changes
+    'overlap': 100          # Entries re-read on each refresh: concurrent writers may commit change_ids out of order
+}
+
+# Columnar catalogue snapshot shared by the server processes on this host (needs pyarrow)
+SNAPSHOT_CONFIG = {
+    'path': 'course_snapshot.arrow',    # Arrow IPC file, replaced atomically per table version (None = off)
+    'save_interval': 10                 # Seconds between rewrites; writes in between share one save
+}
+
+# Field constraints (keep in sync with config_template.py)
+CONSTRAINTS = {
+    'course_code': {
+        'max_length': 10,
+        'required': True
+    },
+    'course_name': {
+        'max_length': 50,
+        'required': True
+    },
+    'course_credits': {
+        'min_value': 1,
+        'max_value': 10,
+        'required': True
+    },
+    'sessions_per_week': {
+        'min_value': 1,
+        'max_value': 10,
+        'required': True
+    }
+}
+
+# Import settings
+IMPORT_CONFIG = {
+    'batch_size': 1000,     # Rows sent per multi-row INSERT
+    'chunk_size': 5000,     # Rows read from the upload and validated at a time
+    'preview_rows': 100,    # Rows shown in the upload preview
+    'max_errors': 1000,     # Error messages kept per import (all errors are still counted)
+    'workers': 1            # Imports run at the same time; further jobs wait in the queue
+}
+
+# Accepted spreadsheet headers for each course field (compared case-insensitively)
+COLUMN_ALIASES = {
+    'course_code': ['course_code', 'coursecode', 'code'],
+    'course_name': ['course_name', 'coursename', 'name'],
+    'course_credits': ['course_credits', 'credits', 'credit'],
+    'sessions_per_week': ['sessions_per_week', 'sessions', 'sessionsperweek']
+}
+
+# Page sizes offered by the course grid
+PAGE_SIZES = [25, 50, 100, 250]
+
+COURSE_COLUMNS = "row_id, course_code, course_name, course_credits, sessions_per_week, row_version"
+
+# Export settings
+EXPORT_CONFIG = {
+    'fetch_size': 5000      # Rows pulled from the server-side cursor at a time
+}
+EXPORT_COLUMNS = ['course_code', 'course_name', 'course_credits', 'sessions_per_week']
+EXPORT_FORMATS = {
+    'csv': ("CSV", "text/csv"),
+    'xlsx': ("Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet")
+}
+
+# Rows removed per DELETE statement by bulk deletes
+DELETE_BATCH_SIZE = 1000
+
+# Number of matches offered by the course picker
+PICKER_LIMIT = 50
+
+# Shortest word the FULLTEXT index can match (InnoDB's innodb_ft_min_token_size)
+FULLTEXT_MIN_WORD = 3
+
+# Performance instrumentation
+METRICS_CONFIG = {
+    'panel': True,          # Offer the sidebar Performance panel
+    'log_json': False,      # Log a JSON summary of every rerun to the 'course_management.perf' logger
+    'host': '127.0.0.1',    # Interface the metrics endpoint listens on ('' = all interfaces)
+    'port': None            # Serve Prometheus text metrics at /metrics on this port (None = disabled)
+}
+
+perf_logger = logging.getLogger("course_management.perf")
+
+# Initialize session state
+if 'refresh' not in st.session_state:
+    st.session_state.refresh = 0
+
+class PerfMetrics:
+    """
+    Timing aggregates and counters for the instrumented hot paths
+    Process-wide totals are shared by every session; the rerun running on the
+    current script thread is tracked separately (background threads have none)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {'reruns': 0, 'queries': 0, 'rows_fetched': 0}
+        self._local = threading.local()
+
+    def start_rerun(self):
+        """Begin collecting metrics for the rerun on the current thread"""
+        self._local.rerun = {'started': time.perf_counter(), 'queries': 0, 'rows': 0, 'timings': {}}
+
+    def finish_rerun(self, page):
+        """Stop collecting for the current thread and return the rerun summary (None if none was started)"""
+        rerun = getattr(self._local, 'rerun', None)
+        if rerun is None:
+            return None
+        self._local.rerun = None
+        self.incr('reruns')
+        return {
+            'page': page,
+            'elapsed': time.perf_counter() - rerun['started'],
+            'queries': rerun['queries'],
+            'rows': rerun['rows'],
+            'timings': {name: {'count': count, 'total': total} for name, (count, total) in rerun['timings'].items()}
+        }
+
+    def observe(self, name, seconds):
+        """Add one timed call of section name"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            rerun = getattr(self._local, 'rerun', None)
+            if rerun is not None:
+                count, total = rerun['timings'].get(name, (0, 0.0))
+                rerun['timings'][name] = (count + 1, total + seconds)
+
+    def count_query(self):
+        """Count one executed statement"""
+        self._count('queries', 'queries', 1)
+
+    def count_rows(self, rows):
+        """Count rows fetched from a result"""
+        self._count('rows_fetched', 'rows', rows)
+
+    def _count(self, counter, field, amount):
+        with self._lock:
+            self._counters[counter] += amount
+            rerun = getattr(self._local, 'rerun', None)
+            if rerun is not None:
+                rerun[field] += amount
+
+    def current_rerun(self):
+        """The metrics of the rerun on this thread, for handing to helper threads"""
+        return getattr(self._local, 'rerun', None)
+
+    def attach_rerun(self, rerun):
+        """Make a helper thread record into the given rerun's metrics (None to detach)"""
+        self._local.rerun = rerun
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Return a copy of the process-wide counters and per-section timings"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timings': {name: dict(timing) for name, timing in self._timings.items()}
+            }
+
+    def prometheus_text(self, pool_stats=None):
+        """Render the process-wide metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP course_app_section_seconds Time spent in instrumented sections",
+            "# TYPE course_app_section_seconds summary"
+        ]
+        for name, timing in sorted(snapshot['timings'].items()):
+            lines.append(f'course_app_section_seconds_count{{section="{name}"}} {timing["count"]}')
+            lines.append(f'course_app_section_seconds_sum{{section="{name}"}} {timing["total"]:.6f}')
+        lines.append("# TYPE course_app_section_seconds_max gauge")
+        for name, timing in sorted(snapshot['timings'].items()):
+            lines.append(f'course_app_section_seconds_max{{section="{name}"}} {timing["max"]:.6f}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE course_app_{name}_total counter")
+            lines.append(f"course_app_{name}_total {value}")
+        if pool_stats:
+            lines.append("# TYPE course_app_pool_connections gauge")
+            for state in ('in_use', 'idle'):
+                lines.append(f'course_app_pool_connections{{state="{state}"}} {pool_stats[state]}')
+            for name in ('checkouts', 'timeouts', 'opened', 'reconnects'):
+                lines.append(f"# TYPE course_app_pool_{name}_total counter")
+                lines.append(f"course_app_pool_{name}_total {pool_stats[name]}")
+            lines.append("# TYPE course_app_pool_wait_seconds_total counter")
+            lines.append(f"course_app_pool_wait_seconds_total {pool_stats['wait_time']:.6f}")
+        return '\n'.join(lines) + '\n'
+
+@st.cache_resource
+def get_perf_metrics():
+    """Return the metrics shared by all sessions of this server process"""
+    if METRICS_CONFIG['log_json'] and not perf_logger.handlers:
+        # One bare JSON document per line, ready for a log shipper
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        perf_logger.addHandler(handler)
+        perf_logger.setLevel(logging.INFO)
+        perf_logger.propagate = False
+    return PerfMetrics()
+
+def log_perf_event(event, **fields):
+    """Write one structured JSON log line when METRICS_CONFIG['log_json'] is on"""
+    if METRICS_CONFIG['log_json']:
+        perf_logger.info(json.dumps({'event': event, 'time': time.time(), **fields}, default=str))
+
+def record_timing(name, seconds):
+    """Record one timed call of section name"""
+    get_perf_metrics().observe(name, seconds)
+
+@contextmanager
+def timed(name):
+    """Time the enclosed block as section name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def instrumented(name):
+    """Decorator timing every call of the wrapped function as section name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def timed_chunks(chunks, name):
+    """Yield from chunks, timing how long each one takes to produce"""
+    chunks = iter(chunks)
+    while True:
+        with timed(name):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+class InstrumentedCursor:
+    """Cursor wrapper that times statements and counts statements and fetched rows"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, operation, params=()):
+        get_perf_metrics().count_query()
+        with timed("db.execute"):
+            return self._cursor.execute(operation, params)
+
+    def executemany(self, operation, seq_params):
+        get_perf_metrics().count_query()
+        with timed("db.executemany"):
+            return self._cursor.executemany(operation, seq_params)
+
+    def fetchall(self):
+        with timed("db.fetch"):
+            rows = self._cursor.fetchall()
+        get_perf_metrics().count_rows(len(rows))
+        return rows
+
+    def fetchmany(self, size=1):
+        with timed("db.fetch"):
+            rows = self._cursor.fetchmany(size)
+        get_perf_metrics().count_rows(len(rows))
+        return rows
+
+def _qmark(operation):
+    """Rewrite %s placeholders as sqlite3's ? (queries never contain a literal %)"""
+    return operation.replace('%s', '?')
+
+def _regexp_substr(value, pattern):
+    """REGEXP_SUBSTR(value, pattern) for SQLite: the first match, or NULL"""
+    if value is None:
+        return None
+    match = re.search(pattern, value)
+    return match.group(0) if match else None
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the %s placeholders the queries are written with"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, operation, params=()):
+        return self._cursor.execute(_qmark(operation), params)
+
+    def executemany(self, operation, seq_params):
+        return self._cursor.executemany(_qmark(operation), seq_params)
+
+class SQLiteConnection:
+    """sqlite3 connection offering the parts of the mysql.connector interface the app uses"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self):
+        return SQLiteCursor(self._connection.cursor())
+
+    def ping(self, reconnect=False):
+        self._connection.execute("SELECT 1").fetchall()
+
+class MySQLBackend:
+    """MySQL server configured by DB_CONFIG"""
+
+    name = 'mysql'
+    label = "MySQL"
+    # MySQL's LIKE already treats backslash as the escape character
+    like_escape = ""
+    fulltext = True
+    upsert_query = """
+    INSERT INTO tbl_courses (course_code, course_name, course_credits, sessions_per_week)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        course_name = VALUES(course_name),
+        course_credits = VALUES(course_credits),
+        sessions_per_week = VALUES(sessions_per_week),
+        row_version = row_version + 1
+    """
+
+    def describe(self):
+        return DB_CONFIG['database']
+
+    def connect(self, overrides=None):
+        return mysql.connector.connect(**{**DB_CONFIG, **(overrides or {})})
+
+    def create_database(self):
+        """Create the configured database if it does not exist yet"""
+        # Connect without database
+        conn = mysql.connector.connect(
+            host=DB_CONFIG['host'],
+            user=DB_CONFIG['user'],
+            password=DB_CONFIG['password']
+        )
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
+            cursor.close()
+        finally:
+            conn.close()
+
+    def lock_schema(self, cursor):
+        # Serialise migrations between server processes starting at the same time
+        cursor.execute("SELECT GET_LOCK('course_schema_migrations', 30)")
+        ((locked,),) = cursor.fetchall()
+        if locked != 1:
+            raise mysql.connector.errors.OperationalError(
+                "Timed out waiting for another server process to finish the schema migrations"
+            )
+
+    def commit_migration(self, conn):
+        conn.commit()
+
+    def unlock_schema(self, cursor):
+        cursor.execute("SELECT RELEASE_LOCK('course_schema_migrations')")
+        cursor.fetchall()
+
+    def create_table_like(self, cursor, table, source):
+        cursor.execute(f"CREATE TABLE {table} LIKE {source}")
+
+    def seed_row_ids(self, cursor, table, next_id):
+        cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {int(next_id)}")
+
+    def swap_tables(self, cursor, table, replacement, old_table):
+        # A multi-table RENAME is atomic: readers see either the old or the new catalogue
+        cursor.execute(f"RENAME TABLE {table} TO {old_table}, {replacement} TO {table}")
+
+    def replica_lag(self, cursor):
+        """Seconds the connected replica is behind its source; None if it is not replicating"""
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            cursor.execute("SHOW SLAVE STATUS")  # Servers before 8.0.22
+        columns = [column[0] for column in cursor.description or ()]
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        status = dict(zip(columns, rows[0]))
+        # NULL while the replication threads are stopped
+        return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+class SQLiteBackend:
+    """Embedded SQLite file in WAL mode: in-process, no server, readers never block the writer"""
+
+    name = 'sqlite'
+    label = "SQLite"
+    like_escape = " ESCAPE '\\'"
+    # No FULLTEXT index; name searches use LIKE
+    fulltext = False
+    upsert_query = """
+    INSERT INTO tbl_courses (course_code, course_name, course_credits, sessions_per_week)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (course_code) DO UPDATE SET
+        course_name = excluded.course_name,
+        course_credits = excluded.course_credits,
+        sessions_per_week = excluded.sessions_per_week,
+        row_version = row_version + 1
+    """
+
+    def describe(self):
+        return SQLITE_CONFIG['path']
+
+    def connect(self, overrides=None):
+        config = {**SQLITE_CONFIG, **(overrides or {})}
+        # The pool hands each connection to one thread at a time, so sharing across threads is safe
+        conn = sqlite3.connect(config['path'], timeout=config['busy_timeout'], check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {config['synchronous']}")
+        conn.create_function("REGEXP_SUBSTR", 2, _regexp_substr, deterministic=True)
+        return SQLiteConnection(conn)
+
+    def create_database(self):
+        pass  # The file is created on first connect
+
+    def lock_schema(self, cursor):
+        # Server processes sharing the file take turns: the write lock is held for the
+        # whole run, which commits as one transaction (SQLite DDL is transactional)
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def commit_migration(self, conn):
+        pass  # Committing would release the lock; ensure_schema commits once at the end
+
+    def unlock_schema(self, cursor):
+        # Only still open when the run failed: undo its partial work
+        if cursor.connection.in_transaction:
+            cursor.connection.rollback()
+
+    def create_table_like(self, cursor, table, source):
+        """Recreate source's table and indexes under new names (SQLite has no CREATE TABLE ... LIKE)"""
+        cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = %s AND sql IS NOT NULL ORDER BY type = 'index'",
+            (source,)
+        )
+        for kind, name, sql in cursor.fetchall():
+            if kind == 'table':
+                sql = re.sub(r'^CREATE TABLE\s+("?)\w+\1', f"CREATE TABLE {table}", sql, count=1)
+            else:
+                # Index names are database-wide: prefix the table, keeping the original name after "__"
+                index = f"{table}__{name.split('__')[-1]}"
+                sql = re.sub(r'INDEX\s+("?)\w+\1\s+ON\s+("?)\w+\2', f"INDEX {index} ON {table}", sql, count=1)
+            cursor.execute(sql)
+
+    def seed_row_ids(self, cursor, table, next_id):
+        # AUTOINCREMENT continues from the table's sqlite_sequence entry (renamed along with the table)
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", (table, next_id - 1))
+
+    def swap_tables(self, cursor, table, replacement, old_table):
+        # SQLite DDL is transactional, so both renames become visible at the same commit
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(f"ALTER TABLE {replacement} RENAME TO {table}")
+
+    def replica_lag(self, cursor):
+        return 0  # A replica is a copy of the file; there is no replication to measure
+
+BACKENDS = {'mysql': MySQLBackend(), 'sqlite': SQLiteBackend()}
+
+def get_backend():
+    """Return the configured storage backend"""
+    return BACKENDS[STORAGE_BACKEND]
+
+class PooledConnection:
+    """Connection handle that goes back to its pool on close()"""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __del__(self):
+        # Safety net for handles that were never closed on an error path
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """Thread-safe pool of reusable database connections with usage statistics"""
+
+    def __init__(self, backend, pool_size=5, checkout_timeout=10, health_check_interval=30, overrides=None):
+        self.backend = backend
+        self.overrides = overrides
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'wait_time': 0.0,
+            'max_wait': 0.0,
+            'timeouts': 0,
+            'in_use': 0,
+            'opened': 0,
+            'reconnects': 0
+        }
+
+    def get_connection(self):
+        """Check out a healthy connection, waiting up to checkout_timeout for a free slot"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise mysql.connector.errors.PoolError(
+                f"No free database connection after {self.checkout_timeout}s "
+                f"(pool size {self.pool_size})"
+            )
+        waited = time.perf_counter() - start
+
+        try:
+            connection = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time'] += waited
+            self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+            self._stats['in_use'] += 1
+        record_timing("db.connect", time.perf_counter() - start)
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """Return a checked-out connection to the idle queue"""
+        try:
+            # End any open transaction so the next user does not inherit a stale snapshot
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put((connection, time.monotonic()))
+        except DB_ERRORS:
+            self._discard(connection)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Return a snapshot of pool usage counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pool_size'] = self.pool_size
+        stats['idle'] = self._idle.qsize()
+        stats['avg_wait'] = stats['wait_time'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def _checkout(self):
+        try:
+            connection, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+        # Health check connections that sat idle long enough to have timed out server-side
+        if time.monotonic() - last_used >= self.health_check_interval:
+            try:
+                connection.ping(reconnect=False)
+            except DB_ERRORS:
+                self._discard(connection)
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                return self._open()
+        return connection
+
+    def _open(self):
+        connection = self.backend.connect(self.overrides)
+        with self._lock:
+            self._stats['opened'] += 1
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except DB_ERRORS:
+            pass
+
+@st.cache_resource
+def get_connection_pool():
+    """Return the connection pool shared by all sessions of this server process"""
+    return ConnectionPool(get_backend(), **POOL_CONFIG)
+
+class ReadRouter:
+    """
+    Sends reads to replicas, round robin, and falls back to the primary
+    A read at a table version only goes to a replica within max_lag that has applied
+    that version, so a session always sees its own writes and results cached under
+    a version are never older than it
+    """
+
+    def __init__(self, primary, replicas, max_lag=5, status_interval=1):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.status_interval = status_interval
+        self._status = {}
+        self._turn = 0
+        self._lock = threading.Lock()
+
+    def get_connection(self, table_version=None):
+        """Check out a connection for a read at table_version (None = any replica within max_lag)"""
+        for index in self._rotation():
+            lag, applied, _ = self.status(index)
+            if lag is None or lag > self.max_lag or (table_version is not None and applied < table_version[0]):
+                continue
+            try:
+                connection = self.replicas[index].get_connection()
+            except DB_ERRORS:
+                self._set_status(index, None, 0)
+                continue
+            get_perf_metrics().incr('replica_reads')
+            return connection
+        get_perf_metrics().incr('primary_reads')
+        return self.primary.get_connection()
+
+    def status(self, index):
+        """Return (lag seconds or None if unusable, applied change_id, checked at) for a replica"""
+        with self._lock:
+            status = self._status.get(index)
+        if status is None or time.monotonic() - status[2] >= self.status_interval:
+            status = self._check(index)
+        return status
+
+    def _check(self, index):
+        lag, applied = None, 0
+        try:
+            conn = self.replicas[index].get_connection()
+            try:
+                cursor = conn.cursor()
+                lag = self.replicas[index].backend.replica_lag(cursor)
+                cursor.execute("SELECT MAX(change_id) FROM tbl_course_changes")
+                ((applied,),) = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+        except DB_ERRORS:
+            lag = None
+        return self._set_status(index, lag, applied or 0)
+
+    def _set_status(self, index, lag, applied):
+        status = (lag, applied, time.monotonic())
+        with self._lock:
+            self._status[index] = status
+        return status
+
+    def _rotation(self):
+        with self._lock:
+            start = self._turn
+            self._turn += 1
+        return [(start + offset) % len(self.replicas) for offset in range(len(self.replicas))]
+
+    def summary(self):
+        """Return the last known (lag, applied change_id) per replica without checking again"""
+        with self._lock:
+            return [self._status.get(index, (None, 0, None))[:2] for index in range(len(self.replicas))]
+
+@st.cache_resource
+def get_read_router():
+    """Return the read router shared by all sessions of this server process"""
+    backend = get_backend()
+    replicas = [ConnectionPool(backend, overrides=config, **POOL_CONFIG) for config in REPLICA_CONFIGS]
+    return ReadRouter(get_connection_pool(), replicas, **REPLICA_ROUTING)
+
+def get_read_connection(table_version=None):
+    """Check out a connection for a read: a caught-up replica if there is one, else the primary"""
+    return get_read_router().get_connection(table_version)
+
+def get_db_connection():
+    """Check out a pooled database connection (close() returns it to the pool)"""
+    try:
+        return get_connection_pool().get_connection()
+    except DB_ERRORS as e:
+        st.error(f"Error connecting to the database: {e}")
+        return None
+
+def _call_in_session(ctx, rerun, func, args, kwargs):
+    """Run func on a lane thread as part of the calling session's rerun"""
+    if ctx is not None:
+        # Lets cached loaders and st.* messages (e.g. st.error) reach the caller's session
+        add_script_run_ctx(threading.current_thread(), ctx)
+    metrics = get_perf_metrics()
+    metrics.attach_rerun(rerun)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        metrics.attach_rerun(None)
+
+class AsyncDataLayer:
+    """
+    asyncio event loop on a daemon thread that schedules the blocking data helpers
+    Reads and writes run on separate bounded executors, so independent reads of one
+    rerun overlap and a long import never occupies the threads interactive reads need
+    """
+
+    def __init__(self, read_concurrency=4, write_concurrency=1):
+        self._loop = asyncio.new_event_loop()
+        self._readers = ThreadPoolExecutor(max_workers=read_concurrency, thread_name_prefix="data-read")
+        self._writers = ThreadPoolExecutor(max_workers=write_concurrency, thread_name_prefix="data-write")
+        threading.Thread(target=self._loop.run_forever, name="data-loop", daemon=True).start()
+
+    async def _run(self, executor, ctx, rerun, func, args, kwargs):
+        return await self._loop.run_in_executor(executor, _call_in_session, ctx, rerun, func, args, kwargs)
+
+    async def _gather(self, ctx, rerun, calls):
+        return await asyncio.gather(*(
+            self._run(self._readers, ctx, rerun, func, args, {}) for func, *args in calls
+        ))
+
+    def gather_reads(self, *calls):
+        """Run (func, *args) read calls concurrently; returns their results in order"""
+        ctx = get_script_run_ctx(suppress_warning=True)
+        rerun = get_perf_metrics().current_rerun()
+        return asyncio.run_coroutine_threadsafe(self._gather(ctx, rerun, calls), self._loop).result()
+
+    def run_write(self, func, *args, **kwargs):
+        """Run a write on the write lane, waiting for a free slot; returns its result"""
+        # No script context: a write may outlive the rerun (or come from an import job)
+        coroutine = self._run(self._writers, None, None, func, args, kwargs)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+@st.cache_resource
+def get_data_layer():
+    """Return the async data layer shared by all sessions of this server process"""
+    return AsyncDataLayer(**ASYNC_CONFIG)
+
+def gather_reads(*calls):
+    """Run independent read helpers concurrently, e.g. gather_reads((count_courses,), (fetch_course_stats,))"""
+    return get_data_layer().gather_reads(*calls)
+
+def _index_exists(cursor, table, name):
+    if get_backend().name == 'sqlite':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = %s", (name,))
+    else:
+        cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+    return bool(cursor.fetchall())
+
+def _create_index(table, name, columns, kind='INDEX'):
+    """Migration step creating an index unless an interrupted earlier run already did"""
+    def create(cursor):
+        if not _index_exists(cursor, table, name):
+            cursor.execute(f"CREATE {kind} {name} ON {table} ({columns})")
+    return create
+
+def _add_column(table, column, definition):
+    """Migration step adding a column unless an interrupted earlier run already did"""
+    def add(cursor):
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        cursor.fetchall()
+        if column not in {description[0] for description in cursor.description}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return add
+
+def _make_course_code_unique(cursor):
+    """Swap the course_code index for a unique key; deferred while duplicate codes exist"""
+    if _index_exists(cursor, 'tbl_courses', 'uq_course_code'):
+        return True
+    cursor.execute("SELECT course_code FROM tbl_courses GROUP BY course_code HAVING COUNT(*) > 1 LIMIT 1")
+    if cursor.fetchall():
+        return False
+    if get_backend().name == 'sqlite':
+        cursor.execute("DROP INDEX IF EXISTS idx_course_code")
+        cursor.execute("CREATE UNIQUE INDEX uq_course_code ON tbl_courses (course_code)")
+    else:
+        cursor.execute("ALTER TABLE tbl_courses DROP INDEX idx_course_code, ADD UNIQUE KEY uq_course_code (course_code)")
+    return True
+
+def _record_instance_id(cursor):
+    """Give the database a random id; an id stored by an earlier attempt is kept"""
+    cursor.execute("SELECT instance_id FROM schema_instance")
+    if not cursor.fetchall():
+        cursor.execute("INSERT INTO schema_instance (instance_id) VALUES (%s)", (uuid.uuid4().hex,))
+
+# Versioned schema migrations, applied in order once per server process.
+# Append new (version, description, statements) entries; never edit applied ones.
+# A statement may be a callable taking the cursor; returning False defers the migration.
+# A dict maps backend names to that backend's statement (None = nothing to do there).
+# MySQL commits each DDL statement on its own, so a migration that stops part-way is
+# run again from the start: every step must be safe to repeat (IF NOT EXISTS or a check).
+SCHEMA_MIGRATIONS = [
+    (1, "Create tbl_courses", [
+        {
+            'mysql': """
+            CREATE TABLE IF NOT EXISTS tbl_courses (
+                row_id INT AUTO_INCREMENT PRIMARY KEY,
+                course_code VARCHAR(10) NOT NULL,
+                course_name VARCHAR(50) NOT NULL,
+                course_credits INT NOT NULL,
+                sessions_per_week INT NOT NULL
+            )
+            """,
+            # NOCASE keeps course_code comparisons case-insensitive, as MySQL's default collation does
+            'sqlite': """
+            CREATE TABLE IF NOT EXISTS tbl_courses (
+                row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                course_code VARCHAR(10) NOT NULL COLLATE NOCASE,
+                course_name VARCHAR(50) NOT NULL,
+                course_credits INTEGER NOT NULL,
+                sessions_per_week INTEGER NOT NULL
+            )
+            """
+        }
+    ]),
+    (2, "Index course_code for prefix search", [
+        _create_index('tbl_courses', 'idx_course_code', 'course_code')
+    ]),
+    (3, "Full-text index on course_name", [
+        {
+            'mysql': _create_index('tbl_courses', 'ft_course_name', 'course_name', kind='FULLTEXT INDEX'),
+            'sqlite': None
+        }
+    ]),
+    (4, "Unique key on course_code", [
+        _make_course_code_unique
+    ]),
+    # One row per written course (values after the write, or before a delete); 'reset' marks a replace import,
+    # with row_id holding the highest id used before it
+    (5, "Create tbl_course_changes", [
+        {
+            'mysql': """
+            CREATE TABLE IF NOT EXISTS tbl_course_changes (
+                change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                op VARCHAR(6) NOT NULL,
+                row_id INT NULL,
+                course_code VARCHAR(10) NULL,
+                course_name VARCHAR(50) NULL,
+                course_credits INT NULL,
+                sessions_per_week INT NULL,
+                changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            'sqlite': """
+            CREATE TABLE IF NOT EXISTS tbl_course_changes (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op VARCHAR(6) NOT NULL,
+                row_id INTEGER NULL,
+                course_code VARCHAR(10) NULL,
+                course_name VARCHAR(50) NULL,
+                course_credits INTEGER NULL,
+                sessions_per_week INTEGER NULL,
+                changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        }
+    ]),
+    # Bumped by every update; updates and deletes only apply while it still matches what the editor read
+    (6, "Row versions for optimistic concurrency", [
+        _add_column('tbl_courses', 'row_version', "INT NOT NULL DEFAULT 1"),
+        _add_column('tbl_course_changes', 'row_version', "INT NOT NULL DEFAULT 1")
+    ]),
+    # Tells copies of the database apart, e.g. a recreated database from the one a snapshot file was taken of
+    (7, "Record a database instance id", [
+        "CREATE TABLE IF NOT EXISTS schema_instance (instance_id VARCHAR(32) NOT NULL)",
+        _record_instance_id
+    ]),
+    # create_staging_table reads MAX(row_id) of the change log before every replace import
+    (8, "Index tbl_course_changes.row_id", [
+        _create_index('tbl_course_changes', 'idx_change_row_id', 'row_id')
+    ]),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+UNIQUE_CODE_MIGRATION = 4
+
+@st.cache_resource
+def ensure_schema():
+    """Create the database, apply pending migrations and log any unlogged swap; runs once per server process"""
+    backend = get_backend()
+    backend.create_database()
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        backend.lock_schema(cursor)
+        try:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(100) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {version for (version,) in cursor.fetchall()}
+
+            for version, description, statements in SCHEMA_MIGRATIONS:
+                if version in applied:
+                    continue
+                deferred = False
+                for statement in statements:
+                    if isinstance(statement, dict):
+                        statement = statement[backend.name]
+                    # Callables can check the data first and return False to retry on a later start
+                    if callable(statement):
+                        deferred = statement(cursor) is False
+                        if deferred:
+                            break
+                        continue
+                    if statement:
+                        cursor.execute(statement)
+                if deferred:
+                    continue
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                backend.commit_migration(conn)
+                applied.add(version)
+            recover_unlogged_swaps(cursor)
+            conn.commit()
+        finally:
+            backend.unlock_schema(cursor)
+        cursor.close()
+        return sorted(applied)
+    finally:
+        conn.close()
+
+def fetch_instance_id():
+    """Return the random id recorded for this database when its schema was created"""
+    conn = get_connection_pool().get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT instance_id FROM schema_instance")
+        ((instance_id,),) = cursor.fetchall()
+        cursor.close()
+        return instance_id
+    finally:
+        conn.close()
+
+def has_unique_course_codes():
+    """True once the unique key on course_code exists (required for merge imports)"""
+    try:
+        return UNIQUE_CODE_MIGRATION in ensure_schema()
+    except DB_ERRORS:
+        return False
+
+def create_database_and_table():
+    """Make sure the database schema is up to date (cached after the first successful run)"""
+    try:
+        ensure_schema()
+        return True
+    except DB_ERRORS as e:
+        st.error(f"Error creating database/table: {e}")
+        return False
+
+class TableVersion:
+    """
+    Version of tbl_courses: (newest change_id in tbl_course_changes, writes committed by this process)
+    A change_id is taken when the entry is inserted, so a write that commits after a later
+    one can leave the newest change_id where it was; counting this process's own writes
+    still moves the version for them. Writes from other server processes are picked up
+    by polling at most every poll_interval seconds
+    """
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._change_id = 0
+        self._writes = 0
+        self._checked = None
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        if self._checked is None or time.monotonic() - self._checked >= self.poll_interval:
+            self.refresh()
+        return (self._change_id, self._writes)
+
+    def note_write(self):
+        """Move the version for a write this process just committed"""
+        with self._lock:
+            self._writes += 1
+        return self.refresh()
+
+    def refresh(self):
+        """Re-read the newest change_id; keeps the last known version while the database is unreachable"""
+        with self._lock:
+            try:
+                conn = get_connection_pool().get_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT MAX(change_id) FROM tbl_course_changes")
+                    ((latest,),) = cursor.fetchall()
+                    cursor.close()
+                finally:
+                    conn.close()
+                self._change_id = max(self._change_id, latest or 0)
+            except DB_ERRORS:
+                pass
+            self._checked = time.monotonic()
+            return (self._change_id, self._writes)
+
+@st.cache_resource
+def get_table_version():
+    """Return the version tracker shared by all sessions of this server process"""
+    return TableVersion(CHANGE_LOG_CONFIG['poll_interval'])
+
+def mark_courses_changed():
+    """Pick up a write this process just committed instead of waiting for the next poll"""
+    get_table_version().note_write()
+
+def refresh_course_data():
+    """Drop every cached course read, for changes written without going through the change log"""
+    for loader in (load_courses_page, load_course_count, load_page_anchor, load_course_stats,
+                   load_matching_row_ids, load_course):
+        loader.clear()
+    get_course_catalogue().invalidate()
+    mark_courses_changed()
+
+CHANGE_LOG_COLUMNS = "op, row_id, course_code, course_name, course_credits, sessions_per_week, row_version"
+
+def log_course_changes(cursor, op, where, params=()):
+    """
+    Record the current values of the tbl_courses rows matching where in the change log
+    Runs on the writer's cursor so the entries commit or roll back with the write;
+    call it after an insert or update and before a delete
+    """
+    cursor.execute(
+        f"INSERT INTO tbl_course_changes ({CHANGE_LOG_COLUMNS}) "
+        f"SELECT %s, {COURSE_COLUMNS} FROM tbl_courses WHERE {where}",
+        (op, *params)
+    )
+
+def log_course_reset(cursor, last_row_id):
+    """
+    Record that tbl_courses was replaced wholesale; readers reload instead of applying earlier changes
+    Earlier entries only describe the replaced table, so they are deleted; the reset keeps
+    last_row_id, the highest row_id used before it, so row ids are never handed out again
+    """
+    cursor.execute("INSERT INTO tbl_course_changes (op, row_id) VALUES ('reset', %s)", (last_row_id,))
+    cursor.execute("DELETE FROM tbl_course_changes WHERE change_id < %s", (cursor.lastrowid,))
+
+def fetch_changes_since(version, limit=None, table_version=None):
+    """
+    Return change-log entries newer than version (a change_id), oldest first
+    op is 'insert', 'update' or 'delete' with the row's values, or 'reset'
+    table_version: read from a replica only once it has applied this TableVersion value
+    """
+    query = f"SELECT change_id, {CHANGE_LOG_COLUMNS}, changed_at FROM tbl_course_changes WHERE change_id > %s ORDER BY change_id"
+    params = [version]
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    conn = get_read_connection(table_version)
+    try:
+        return query_dataframe(conn, query, params)
+    finally:
+        conn.close()
+
+def apply_course_changes(df, changes):
+    """Apply change-log entries (without resets) to a catalogue frame; returns a new frame in row_id order"""
+    if changes.empty:
+        return df
+    latest = changes.drop_duplicates('row_id', keep='last')
+    kept = df[~df['row_id'].isin(latest['row_id'])]
+    written = latest.loc[latest['op'] != 'delete', df.columns]
+    result = pd.DataFrame({
+        # Categorical columns stay encoded: the new values are appended to the categories
+        column: union_categoricals([kept[column].array, pd.Categorical(written[column])])
+        if isinstance(df[column].dtype, pd.CategoricalDtype)
+        else pd.concat([kept[column], written[column]], ignore_index=True)
+        for column in df.columns
+    })
+    for column in df.columns:
+        # Replaced and deleted values stay in the categories; prune them once they outnumber the rows
+        if isinstance(result[column].dtype, pd.CategoricalDtype) and len(result[column].cat.categories) > 2 * len(result) + 100:
+            result[column] = result[column].cat.remove_unused_categories()
+    if not result['row_id'].is_monotonic_increasing:
+        result = result.sort_values('row_id', ignore_index=True)
+    return result
+
+def compact_courses(df):
+    """
+    Shrink a catalogue frame without changing its values: categorical strings and
+    the smallest integer dtypes (int8 for credits and sessions, int32 for row_id)
+    """
+    compact = df.astype({column: 'category' for column in ('course_code', 'course_name')
+                         if not isinstance(df[column].dtype, pd.CategoricalDtype)})
+    for column in ('row_id', 'course_credits', 'sessions_per_week'):
+        compact[column] = pd.to_numeric(compact[column], downcast='integer')
+    return compact
+
+class CatalogueSnapshot:
+    """
+    Catalogue written as an Arrow IPC file that every server process on the host memory-maps
+    Strings are dictionary-encoded and the numeric columns are read from the map without a copy;
+    a new version is written to a temporary file and renamed over the old one, so readers
+    always see a complete file (a reader keeps its mapping of the file it opened)
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    def load(self, newer_than=None):
+        """Return (frame, version) if the file holds a version of this database newer than newer_than, else None"""
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(self.path))
+        except (OSError, pa.ArrowInvalid):
+            return None
+        metadata = reader.schema.metadata or {}
+        if metadata.get(b'source', b'').decode() != self.source:
+            return None
+        version = int(metadata[b'version'])
+        if newer_than is not None and version <= newer_than:
+            return None
+        with timed("catalogue.snapshot_load"):
+            return reader.read_all().to_pandas(split_blocks=True), version
+
+    def save(self, df, version):
+        """Publish df as version; best effort, a failed write leaves the previous file in place"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.course_snapshot_', dir=directory)
+        try:
+            with timed("catalogue.snapshot_save"):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                schema = table.schema.with_metadata({'source': self.source, 'version': str(version)})
+                with os.fdopen(fd, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                    writer.write_table(table.replace_schema_metadata(schema.metadata))
+                os.replace(tmp_path, self.path)
+        except (OSError, pa.ArrowException):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class CourseCatalogue:
+    """
+    Process-wide compact copy of the whole course table, kept current by applying
+    the change-log entries since its change_id; a reset or a large backlog reloads it
+    With a snapshot, a newer version published by another process is mapped instead,
+    and this process publishes the versions it builds, at most every save_interval seconds
+    """
+
+    def __init__(self, max_delta, overlap, snapshot=None, save_interval=0):
+        self.max_delta = max_delta
+        self.overlap = overlap
+        self.snapshot = snapshot
+        self.save_interval = save_interval
+        self._df = None
+        self._change_id = None
+        self._applied = None    # change_ids of the last delta read; None when unknown
+        self._dirty = False     # built here and not yet published
+        self._saved_at = None
+        self._lock = threading.Lock()
+
+    def get(self, version):
+        """Return the catalogue as of at least version (treat the frame as read-only)"""
+        # Only the change_id counts: the local write count means nothing to the rows or to a snapshot
+        change_id = version[0]
+        with self._lock:
+            if self._df is not None and change_id <= self._change_id:
+                return self._df
+            if self.snapshot:
+                shared = self.snapshot.load(newer_than=self._change_id if self._df is not None else None)
+                if shared:
+                    self._df, self._change_id = shared
+                    self._applied = None
+                    self._dirty = False
+            if self._df is None:
+                self._reload(version)
+            elif change_id > self._change_id:
+                self._apply_delta(version)
+            self._publish()
+            return self._df
+
+    def invalidate(self):
+        """Drop the copy (and the shared snapshot); the next read loads the table in full"""
+        with self._lock:
+            self._df = None
+            self._dirty = False
+            if self.snapshot:
+                self.snapshot.discard()
+
+    def _apply_delta(self, version):
+        with timed("catalogue.delta"):
+            # Entries are applied per row_id in change_id order, so re-reading a few is harmless
+            since = max(self._change_id - self.overlap, 0)
+            changes = fetch_changes_since(since, self.max_delta + self.overlap + 1, table_version=version)
+            resets = changes.loc[changes['op'] == 'reset', 'change_id']
+            if len(changes) > self.max_delta + self.overlap or (resets > self._change_id).any():
+                self._reload(version)
+                return
+            read = set(changes['change_id'].tolist())
+            # Entries from before a reset describe the replaced table
+            if not resets.empty:
+                changes = changes[changes['change_id'] > resets.iloc[-1]]
+            # Rebuild only for entries not applied yet (new ones, or late commits in the overlap)
+            fresh = changes if self._applied is None else changes[~changes['change_id'].isin(self._applied)]
+            if not fresh.empty:
+                self._df = compact_courses(apply_course_changes(self._df, changes))
+                self._dirty = True
+            self._change_id = version[0]
+            self._applied = read
+
+    def _reload(self, version):
+        # Rows are read after version was taken, so they already include every change up to it;
+        # re-applying a later entry is harmless because changes are keyed on row_id
+        self._df = compact_courses(load_all_courses(version))
+        self._change_id = version[0]
+        self._applied = None
+        self._dirty = True
+
+    def _publish(self):
+        # Writes landing within save_interval of the last save share one rewrite of the file
+        if not (self.snapshot and self._dirty):
+            return
+        if self._saved_at is not None and time.monotonic() - self._saved_at < self.save_interval:
+            return
+        self.snapshot.save(self._df, self._change_id)
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+@st.cache_resource
+def get_course_catalogue():
+    """Return the catalogue copy shared by all sessions of this server process"""
+    snapshot = None
+    if SNAPSHOT_CONFIG['path'] and pa is not None:
+        backend = get_backend()
+        # The instance id keeps a file from a dropped and recreated database from being adopted
+        snapshot = CatalogueSnapshot(SNAPSHOT_CONFIG['path'], f"{backend.name}:{backend.describe()}:{fetch_instance_id()}")
+    return CourseCatalogue(CHANGE_LOG_CONFIG['max_delta'], CHANGE_LOG_CONFIG['overlap'], snapshot,
+                           SNAPSHOT_CONFIG['save_interval'])
+
+def query_dataframe(conn, query, params=None):
+    """Run a SELECT on an open connection and return the rows as a DataFrame"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params or ())
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        with timed("pandas.dataframe"):
+            return pd.DataFrame(rows, columns=columns)
+    finally:
+        cursor.close()
+
+@instrumented("query.all_courses")
+def load_all_courses(table_version=None):
+    """Read the whole course table (uncached; see CourseCatalogue), from a replica that has applied table_version"""
+    conn = get_read_connection(table_version)
+    try:
+        query = f"SELECT {COURSE_COLUMNS} FROM tbl_courses ORDER BY row_id"
+        return query_dataframe(conn, query)
+    finally:
+        conn.close()
+
+def fetch_all_courses():
+    """Fetch all courses from the shared catalogue, reading only the changes since it was last used"""
+    try:
+        return get_course_catalogue().get(get_table_version().value)
+    except DB_ERRORS as e:
+        st.error(f"Error fetching data: {e}")
+        return pd.DataFrame()
+
+def _escape_like(value):
+    """Escape LIKE wildcards so user input matches literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _name_match_clause(text):
+    """
+    SQL condition matching course names containing text
+    Whole words of 3+ characters use the FULLTEXT index as word-prefix matches;
+    anything shorter falls back to a LIKE substring scan
+    """
+    backend = get_backend()
+    words = re.findall(r"\w+", text)
+    if backend.fulltext and words and all(len(word) >= FULLTEXT_MIN_WORD for word in words):
+        return "MATCH(course_name) AGAINST (%s IN BOOLEAN MODE)", ' '.join(f"+{word}*" for word in words)
+    return f"course_name LIKE %s{backend.like_escape}", f"%{_escape_like(text)}%"
+
+def build_course_filter(filters):
+    """Translate a filters dict into a SQL WHERE fragment (starting with AND) and its parameters"""
+    clauses = []
+    params = []
+    filters = filters or {}
+    like_escape = get_backend().like_escape
+    
+    if filters.get('query'):
+        name_clause, name_param = _name_match_clause(filters['query'])
+        clauses.append(f"(course_code LIKE %s{like_escape} OR {name_clause})")
+        params.extend([_escape_like(filters['query']) + '%', name_param])
+    if filters.get('code_prefix'):
+        clauses.append(f"course_code LIKE %s{like_escape}")
+        params.append(_escape_like(filters['code_prefix']) + '%')
+    if filters.get('name'):
+        name_clause, name_param = _name_match_clause(filters['name'])
+        clauses.append(name_clause)
+        params.append(name_param)
+    if filters.get('credits'):
+        clauses.append("course_credits BETWEEN %s AND %s")
+        params.extend(filters['credits'])
+    if filters.get('sessions'):
+        clauses.append("sessions_per_week BETWEEN %s AND %s")
+        params.extend(filters['sessions'])
+    
+    return ''.join(f" AND {clause}" for clause in clauses), params
+
+@st.cache_data(show_spinner=False, max_entries=256)
+@instrumented("query.courses_page")
+def load_courses_page(table_version, after_row_id, page_size, filters=None):
+    """Read one page of matching courses following after_row_id (keyset pagination on the primary key)"""
+    where, params = build_course_filter(filters)
+    conn = get_read_connection(table_version)
+    try:
+        query = f"SELECT {COURSE_COLUMNS} FROM tbl_courses WHERE row_id > %s{where} ORDER BY row_id LIMIT %s"
+        return query_dataframe(conn, query, (after_row_id, *params, page_size))
+    finally:
+        conn.close()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+@instrumented("query.course_count")
+def load_course_count(table_version, filters=None):
+    """Count the matching courses; cached per table version"""
+    where, params = build_course_filter(filters)
+    conn = get_read_connection(table_version)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM tbl_courses WHERE 1 = 1{where}", params)
+        # fetchall() drains the unbuffered result so the pooled connection stays usable
+        ((count,),) = cursor.fetchall()
+        cursor.close()
+        return count
+    finally:
+        conn.close()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+@instrumented("query.page_anchor")
+def load_page_anchor(table_version, page, page_size, filters=None):
+    """Return the row_id that a 1-based page starts after, walking only the indexes"""
+    if page <= 1:
+        return 0
+    where, params = build_course_filter(filters)
+    conn = get_read_connection(table_version)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT row_id FROM tbl_courses WHERE 1 = 1{where} ORDER BY row_id LIMIT 1 OFFSET %s",
+            (*params, (page - 1) * page_size - 1)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows[0][0] if rows else 0
+    finally:
+        conn.close()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+@instrumented("query.course_stats")
+def load_course_stats(table_version):
+    """Compute catalogue statistics with SQL aggregates; cached per table version"""
+    conn = get_read_connection(table_version)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT COUNT(*), AVG(course_credits), AVG(sessions_per_week),
+               MIN(course_credits), MAX(course_credits),
+               MIN(sessions_per_week), MAX(sessions_per_week)
+        FROM tbl_courses
+        """)
+        ((total, avg_credits, avg_sessions, min_credits, max_credits, min_sessions, max_sessions),) = cursor.fetchall()
+        
+        cursor.execute("SELECT course_credits, COUNT(*) FROM tbl_courses GROUP BY course_credits ORDER BY course_credits")
+        credit_histogram = {int(value): count for value, count in cursor.fetchall()}
+        cursor.execute("SELECT sessions_per_week, COUNT(*) FROM tbl_courses GROUP BY sessions_per_week ORDER BY sessions_per_week")
+        session_histogram = {int(value): count for value, count in cursor.fetchall()}
+        
+        # Code prefix = the leading letters of course_code (CS101 -> CS)
+        cursor.execute("""
+        SELECT REGEXP_SUBSTR(course_code, '^[A-Za-z]+') AS prefix, COUNT(*) AS courses
+        FROM tbl_courses
+        GROUP BY prefix
+        HAVING prefix IS NOT NULL
+        ORDER BY courses DESC, prefix
+        """)
+        prefixes = {prefix: count for prefix, count in cursor.fetchall()}
+        cursor.close()
+    finally:
+        conn.close()
+    
+    return {
+        'total': total,
+        'avg_credits': float(avg_credits) if avg_credits is not None else 0.0,
+        'avg_sessions': float(avg_sessions) if avg_sessions is not None else 0.0,
+        'min_credits': min_credits,
+        'max_credits': max_credits,
+        'min_sessions': min_sessions,
+        'max_sessions': max_sessions,
+        'credit_histogram': credit_histogram,
+        'session_histogram': session_histogram,
+        'prefixes': prefixes
+    }
+
+def fetch_course_stats():
+    """Return catalogue statistics, or None if they could not be computed"""
+    try:
+        return load_course_stats(get_table_version().value)
+    except DB_ERRORS as e:
+        st.error(f"Error computing statistics: {e}")
+        return None
+
+@st.cache_data(show_spinner=False, max_entries=16)
+@instrumented("query.matching_row_ids")
+def load_matching_row_ids(table_version, filters=None):
+    """Read just the row_ids of the matching courses"""
+    where, params = build_course_filter(filters)
+    conn = get_read_connection(table_version)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT row_id FROM tbl_courses WHERE 1 = 1{where} ORDER BY row_id", params)
+        row_ids = [row_id for (row_id,) in cursor.fetchall()]
+        cursor.close()
+        return row_ids
+    finally:
+        conn.close()
+
+def fetch_courses_page(after_row_id, page_size, filters=None):
+    """Fetch up to page_size matching courses with row_id greater than after_row_id"""
+    try:
+        return load_courses_page(get_table_version().value, after_row_id, page_size, filters)
+    except DB_ERRORS as e:
+        st.error(f"Error fetching data: {e}")
+        return pd.DataFrame()
+
+def count_courses(filters=None):
+    """Return the number of courses (matching filters, if given)"""
+    try:
+        return load_course_count(get_table_version().value, filters)
+    except DB_ERRORS as e:
+        st.error(f"Error counting courses: {e}")
+        return 0
+
+def fetch_matching_row_ids(filters=None):
+    """Return the row_ids of every course matching filters"""
+    try:
+        return load_matching_row_ids(get_table_version().value, filters)
+    except DB_ERRORS as e:
+        st.error(f"Error fetching data: {e}")
+        return []
+
+def search_courses(filters, limit=100):
+    """Return the first matching courses in row_id order"""
+    return fetch_courses_page(0, limit, filters)
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+@instrumented("query.course")
+def load_course(table_version, row_id):
+    """Read a single course by primary key; cached per table version"""
+    conn = get_read_connection(table_version)
+    try:
+        df = query_dataframe(conn, f"SELECT {COURSE_COLUMNS} FROM tbl_courses WHERE row_id = %s", (row_id,))
+    finally:
+        conn.close()
+    return df.iloc[0].to_dict() if not df.empty else None
+
+def fetch_course(row_id):
+    """Fetch one course as a dict, or None if it does not exist"""
+    try:
+        return load_course(get_table_version().value, row_id)
+    except DB_ERRORS as e:
+        st.error(f"Error fetching course: {e}")
+        return None
+
+def render_course_picker(label, key):
+    """Typeahead course picker over the top matches by code or name; returns the chosen row_id or None"""
+    term = st.text_input("Find course", placeholder="Type a course code or name", key=f"{key}_search")
+    filters = {'query': term.strip()} if term.strip() else None
+    matches = search_courses(filters, PICKER_LIMIT)
+    if matches.empty:
+        st.info("No courses match your search.")
+        return None
+    
+    labels = {
+        row_id: f"ID: {row_id} - {code} {name}"
+        for row_id, code, name in zip(
+            matches['row_id'].tolist(), matches['course_code'].tolist(), matches['course_name'].tolist()
+        )
+    }
+    if len(matches) == PICKER_LIMIT:
+        st.caption(f"Showing the first {PICKER_LIMIT} matches; keep typing to narrow them down.")
+    return st.selectbox(label, options=list(labels), format_func=labels.get, key=f"{key}_choice")
+
+def get_page_anchor(page, page_size, key, filters=None):
+    """Return the keyset anchor for a page, reusing anchors learned while paging"""
+    state_key = f"{key}_anchors"
+    signature = (get_table_version().value, page_size, filters)
+    state = st.session_state.get(state_key)
+    if not state or state['signature'] != signature:
+        state = {'signature': signature, 'anchors': {1: 0}}
+        st.session_state[state_key] = state
+
+    if page not in state['anchors']:
+        try:
+            state['anchors'][page] = load_page_anchor(signature[0], page, page_size, filters)
+        except DB_ERRORS as e:
+            st.error(f"Error fetching data: {e}")
+            return 0
+    return state['anchors'][page]
+
+def remember_next_anchor(page, page_size, key, df, filters=None):
+    """Record where the following page starts so Next needs no extra query"""
+    state = st.session_state.get(f"{key}_anchors")
+    if state and state['signature'] == (get_table_version().value, page_size, filters) and not df.empty:
+        state['anchors'][page + 1] = int(df['row_id'].iloc[-1])
+
+def course_filters_from_state(key):
+    """Build the filters dict from the filter widgets' session state (None when nothing is filtered)"""
+    state = st.session_state
+    filters = {}
+    for field in ('query', 'code_prefix', 'name'):
+        value = state.get(f"{key}_{field}", "").strip()
+        if value:
+            filters[field] = value
+    for field in ('credits', 'sessions'):
+        value = tuple(state.get(f"{key}_{field}", (1, 10)))
+        if value != (1, 10):
+            filters[field] = value
+    return filters or None
+
+def render_course_filters(key):
+    """Show the search and filter controls; returns a filters dict (None when nothing is filtered)"""
+    with st.expander("🔍 Search & Filter", expanded=bool(st.session_state.get(f"{key}_query"))):
+        st.text_input("Search", placeholder="Course code or name", key=f"{key}_query")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.text_input("Code starts with", key=f"{key}_code_prefix")
+            st.slider("Credits", 1, 10, (1, 10), key=f"{key}_credits")
+        with col2:
+            st.text_input("Name contains", key=f"{key}_name",
+                                 help="Words of 3+ letters match word beginnings via the full-text index")
+            st.slider("Sessions/Week", 1, 10, (1, 10), key=f"{key}_sessions")
+    return course_filters_from_state(key)
+
+def render_course_page(key, filters=None):
+    """Show paging controls and fetch the current page; returns (page DataFrame, number of matching courses)"""
+    total = count_courses(filters)
+    if total == 0:
+        return pd.DataFrame(), 0
+
+    col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+    with col1:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    page_count = max(1, ceil(total / page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+
+    def step(delta):
+        st.session_state[page_key] = min(max(1, st.session_state.get(page_key, 1) + delta), page_count)
+
+    with col2:
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key=page_key)
+    with col3:
+        st.button("◀ Prev", on_click=step, args=(-1,), disabled=page <= 1,
+                  use_container_width=True, key=f"{key}_prev")
+    with col4:
+        st.button("Next ▶", on_click=step, args=(1,), disabled=page >= page_count,
+                  use_container_width=True, key=f"{key}_next")
+
+    df = fetch_courses_page(get_page_anchor(page, page_size, key, filters), page_size, filters)
+    remember_next_anchor(page, page_size, key, df, filters)
+    first = (page - 1) * page_size + 1
+    st.caption(f"Showing courses {first}-{first + len(df) - 1} of {total}")
+    return df, total
+
+def render_course_grid(key, height=400, filters=None):
+    """Show the (filtered) course table one page at a time; returns the number of matching courses"""
+    df, total = render_course_page(key, filters)
+    if total:
+        st.dataframe(df, use_container_width=True, height=height, hide_index=True,
+                     column_config={'row_version': None})
+    return total
+
+def clear_course_selection(key):
+    """Empty a course selector's selection"""
+    st.session_state.setdefault(f"{key}_selected", set()).clear()
+    # New editor key so the grid drops its own edit state and re-reads the selection
+    st.session_state[f"{key}_generation"] = st.session_state.get(f"{key}_generation", 0) + 1
+
+def render_course_selector(key, filters=None):
+    """
+    Paged grid with a selection column; the selection survives paging and filtering
+    Returns the set of selected row_ids
+    """
+    selected = st.session_state.setdefault(f"{key}_selected", set())
+    generation_key = f"{key}_generation"
+    
+    def replace_selection(row_ids):
+        clear_course_selection(key)
+        selected.update(row_ids)
+    
+    df, total = render_course_page(key, filters)
+    if total == 0:
+        return selected
+    
+    grid = df.copy()
+    grid.insert(0, "Select", grid['row_id'].isin(selected))
+    edited = st.data_editor(
+        grid,
+        hide_index=True,
+        use_container_width=True,
+        disabled=[column for column in grid.columns if column != "Select"],
+        column_config={"Select": st.column_config.CheckboxColumn("Select", default=False), 'row_version': None},
+        # Checkbox edits are stored by position: keyed on the page's exact rows, a page that another
+        # session's write has shifted gets a fresh grid, which re-reads the selection by row_id
+        key=f"{key}_editor_{st.session_state.get(generation_key, 0)}_{hash(tuple(grid['row_id'].tolist()))}"
+    )
+    page_ids = edited['row_id'].tolist()
+    selected.difference_update(page_ids)
+    selected.update(edited.loc[edited['Select'], 'row_id'].tolist())
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"☑️ Select all {total} matching", use_container_width=True, key=f"{key}_select_all"):
+            replace_selection(fetch_matching_row_ids(filters))
+            st.rerun()
+    with col2:
+        if st.button("✖️ Clear selection", use_container_width=True, key=f"{key}_clear",
+                     disabled=not selected):
+            replace_selection([])
+            st.rerun()
+    return selected
+
+def diff_course_edits(snapshot, edits):
+    """
+    Turn a data_editor's edit state into changes against the page snapshot it was given
+    Returns (inserts, updates, deletes): new rows as dicts, (row_id, row dict, changed fields, row_version)
+    for edited rows whose values really changed, and (row_id, row_version) of the deleted rows
+    """
+    deleted = set(edits.get('deleted_rows', []))
+    deletes = [
+        (int(snapshot['row_id'].iloc[position]), int(snapshot['row_version'].iloc[position]))
+        for position in sorted(deleted)
+    ]
+    
+    updates = []
+    for position, changes in edits.get('edited_rows', {}).items():
+        if int(position) in deleted:
+            continue
+        original = snapshot.iloc[int(position)]
+        row = {field: changes.get(field, original[field]) for field in EXPORT_COLUMNS}
+        changed = {field for field in EXPORT_COLUMNS if field in changes and changes[field] != original[field]}
+        if changed:
+            updates.append((int(original['row_id']), row, changed, int(original['row_version'])))
+    
+    inserts = [
+        {field: added.get(field) for field in EXPORT_COLUMNS}
+        for added in edits.get('added_rows', [])
+        if any(added.get(field) not in (None, '') for field in EXPORT_COLUMNS)
+    ]
+    return inserts, updates, deletes
+
+def validate_course_edits(inserts, updates):
+    """
+    Check added and changed grid rows with the import validation rules
+    Returns (insert rows, update rows, errors); the rows are cleaned tuples ready for save_course_edits
+    """
+    labels = [f"New row {number}" for number in range(1, len(inserts) + 1)]
+    labels += [f"Course ID {row_id}" for row_id, _, _, _ in updates]
+    df = pd.DataFrame(inserts + [row for _, row, _, _ in updates], columns=EXPORT_COLUMNS)
+    fields, failures, messages, _ = evaluate_course_rules(df)
+    blocking = blocking_rules()
+    reasons = first_failure_messages(failures, messages, blocking)
+    errors = [f"{label}: {reason}" for label, reason in zip(labels, reasons) if reason]
+    if errors:
+        return [], [], errors
+    
+    rows = list(zip(
+        fields['course_code'].tolist(),
+        fields['course_name'].tolist(),
+        fields['course_credits'].astype(int).tolist(),
+        fields['sessions_per_week'].astype(int).tolist()
+    ))
+    insert_rows = rows[:len(inserts)]
+    update_rows = [
+        (row_id, values, changed, row_version)
+        for (row_id, _, changed, row_version), values in zip(updates, rows[len(inserts):])
+    ]
+    return insert_rows, update_rows, []
+
+# Parts of a data_editor's edit state
+EDIT_KINDS = ('edited_rows', 'added_rows', 'deleted_rows')
+
+def render_course_editor(key, height=400, filters=None):
+    """
+    Editable paged grid: edit cells, add rows at the bottom or delete rows, then save
+    everything in one transaction; returns the number of matching courses
+    While there are unsaved edits the grid keeps the rows as they were loaded, so a save
+    only applies to rows nobody else has changed since (see save_course_edits)
+    """
+    generation_key = f"{key}_generation"
+    saved_key = f"{key}_saved"
+    snapshot_key = f"{key}_snapshot"
+    if saved_key in st.session_state:
+        st.success(st.session_state.pop(saved_key))
+    
+    df, total = render_course_page(key, filters)
+    if total == 0:
+        return total
+    
+    # Keyed on the page the user asked for, not on its rows, so another session's write does not
+    # reset the editor; paging or changing the filters starts a fresh one (unsaved edits are dropped)
+    page = (st.session_state.get(f"{key}_page", 1), st.session_state.get(f"{key}_page_size"))
+    editor_key = f"{key}_grid_{st.session_state.get(generation_key, 0)}_{page[0]}_{page[1]}_{json.dumps(filters, sort_keys=True)}"
+    edits = st.session_state.get(editor_key, {})
+    pinned = st.session_state.get(snapshot_key)
+    if pinned is None or pinned[0] != editor_key or not any(edits.get(kind) for kind in EDIT_KINDS):
+        pinned = st.session_state[snapshot_key] = (editor_key, df)
+    df = pinned[1]
+    st.data_editor(
+        df,
+        key=editor_key,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        height=height,
+        column_config={
+            'row_id': st.column_config.NumberColumn("ID", disabled=True),
+            'row_version': None,
+            'course_code': st.column_config.TextColumn(
+                "Course Code", required=True, max_chars=CONSTRAINTS['course_code']['max_length']
+            ),
+            'course_name': st.column_config.TextColumn(
+                "Course Name", required=True, max_chars=CONSTRAINTS['course_name']['max_length']
+            ),
+            'course_credits': st.column_config.NumberColumn(
+                "Credits", required=True, step=1,
+                min_value=CONSTRAINTS['course_credits']['min_value'],
+                max_value=CONSTRAINTS['course_credits']['max_value']
+            ),
+            'sessions_per_week': st.column_config.NumberColumn(
+                "Sessions/Week", required=True, step=1,
+                min_value=CONSTRAINTS['sessions_per_week']['min_value'],
+                max_value=CONSTRAINTS['sessions_per_week']['max_value']
+            )
+        }
+    )
+    
+    inserts, updates, deletes = diff_course_edits(df, edits)
+    if not (inserts or updates or deletes):
+        st.caption("Edit cells, add rows at the bottom or select rows to delete, then save.")
+        return total
+    
+    col1, col2, col3 = st.columns([3, 1, 1])
+    with col1:
+        st.info(f"Unsaved changes: {len(inserts)} new, {len(updates)} changed, {len(deletes)} deleted")
+    with col2:
+        save = st.button("💾 Save Changes", type="primary", use_container_width=True, key=f"{key}_save")
+    with col3:
+        if st.button("↩️ Discard", use_container_width=True, key=f"{key}_discard"):
+            st.session_state[generation_key] = st.session_state.get(generation_key, 0) + 1
+            st.rerun()
+    
+    if save:
+        insert_rows, update_rows, errors = validate_course_edits(inserts, updates)
+        if errors:
+            st.error(f"❌ {len(errors)} row(s) need fixing before saving:")
+            for error in errors[:10]:
+                st.write(f"- {error}")
+            return total
+        success, message, conflicts = save_course_edits(insert_rows, update_rows, deletes)
+        if success:
+            st.session_state[generation_key] = st.session_state.get(generation_key, 0) + 1
+            st.session_state[saved_key] = message
+            st.rerun()
+        st.error(message)
+        if conflicts is not None and not conflicts.empty:
+            st.markdown("Current values on the server (**Discard** reloads the page with them, "
+                        "then re-apply your edits):")
+            st.dataframe(conflicts, use_container_width=True, hide_index=True,
+                         column_config={'row_version': None})
+    return total
+
+def insert_course(course_code, course_name, course_credits, sessions_per_week):
+    """Insert a new course record"""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            query = """
+            INSERT INTO tbl_courses (course_code, course_name, course_credits, sessions_per_week)
+            VALUES (%s, %s, %s, %s)
+            """
+            cursor.execute(query, (course_code, course_name, course_credits, sessions_per_week))
+            log_course_changes(cursor, 'insert', "row_id = %s", (cursor.lastrowid,))
+            conn.commit()
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, "Course added successfully!"
+        except DB_ERRORS as e:
+            conn.close()
+            return False, f"Error inserting course: {e}"
+    return False, "Database connection failed"
+
+def fetch_current_courses(cursor, row_ids):
+    """Read the committed values of courses on a writer's cursor; returns {row_id: course dict}"""
+    if not row_ids:
+        return {}
+    cursor.execute(
+        f"SELECT {COURSE_COLUMNS} FROM tbl_courses WHERE row_id IN (%s)" % ','.join(['%s'] * len(row_ids)),
+        list(row_ids)
+    )
+    columns = [column[0] for column in cursor.description]
+    return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+def _conflict_message(current):
+    if current is None:
+        return "This course was deleted by someone else since you loaded it"
+    return "This course was changed by someone else since you loaded it; review the current values"
+
+def update_course(row_id, course_code, course_name, course_credits, sessions_per_week, row_version):
+    """
+    Update a course if it is still at row_version (the version the editor loaded)
+    Returns (success, message, current): after a conflict current holds the server's
+    values to merge with (None if the course was deleted), otherwise it is None
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            query = """
+            UPDATE tbl_courses 
+            SET course_code = %s, course_name = %s, course_credits = %s, sessions_per_week = %s,
+                row_version = row_version + 1
+            WHERE row_id = %s AND row_version = %s
+            """
+            cursor.execute(query, (course_code, course_name, course_credits, sessions_per_week, row_id, row_version))
+            if cursor.rowcount == 0:
+                current = fetch_current_courses(cursor, [row_id]).get(row_id)
+                cursor.close()
+                conn.close()
+                return False, _conflict_message(current), current
+            log_course_changes(cursor, 'update', "row_id = %s", (row_id,))
+            conn.commit()
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, "Course updated successfully!", None
+        except DB_ERRORS as e:
+            conn.close()
+            return False, f"Error updating course: {e}", None
+    return False, "Database connection failed", None
+
+def delete_course(row_id, row_version):
+    """
+    Delete a course if it is still at row_version
+    Returns (success, message, current) as update_course does
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            where = "row_id = %s AND row_version = %s"
+            log_course_changes(cursor, 'delete', where, (row_id, row_version))
+            cursor.execute(f"DELETE FROM tbl_courses WHERE {where}", (row_id, row_version))
+            if cursor.rowcount == 0:
+                current = fetch_current_courses(cursor, [row_id]).get(row_id)
+                cursor.close()
+                conn.close()
+                return False, _conflict_message(current), current
+            conn.commit()
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, "Course deleted successfully!", None
+        except DB_ERRORS as e:
+            conn.close()
+            return False, f"Error deleting course: {e}", None
+    return False, "Database connection failed", None
+
+def delete_multiple_courses(row_ids):
+    """Delete multiple course records in chunks, committing after each chunk"""
+    row_ids = [int(row_id) for row_id in row_ids]
+    conn = get_db_connection()
+    if conn:
+        deleted = 0
+        try:
+            cursor = conn.cursor()
+            batch_size = DELETE_BATCH_SIZE
+            # Bounded IN lists keep statements under max_allowed_packet and locks short
+            for start in range(0, len(row_ids), batch_size):
+                batch = row_ids[start:start + batch_size]
+                where = "row_id IN (%s)" % ','.join(['%s'] * len(batch))
+                log_course_changes(cursor, 'delete', where, batch)
+                cursor.execute(f"DELETE FROM tbl_courses WHERE {where}", batch)
+                conn.commit()
+                deleted += cursor.rowcount
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, f"{deleted} course(s) deleted successfully!"
+        except DB_ERRORS as e:
+            conn.close()
+            if deleted:
+                mark_courses_changed()
+            return False, f"Error deleting courses after {deleted} deletion(s): {e}"
+    return False, "Database connection failed"
+
+def _versioned_rows_clause(rows):
+    """WHERE clause matching (row_id, row_version) pairs; returns (clause, params)"""
+    clause = "(row_id, row_version) IN (%s)" % ','.join(['(%s, %s)'] * len(rows))
+    return clause, [value for row in rows for value in row]
+
+def _bulk_update_query(updates):
+    """
+    One UPDATE for many rows: each changed field is set from a CASE over row_id,
+    fields a row did not change keep their current value
+    updates: (row_id, values, changed fields, row_version) with values in EXPORT_COLUMNS order;
+    rows no longer at their row_version are left alone (compare the row count)
+    Returns (query, params)
+    """
+    assignments = []
+    params = []
+    for position, field in enumerate(EXPORT_COLUMNS):
+        changed = [(row_id, values[position]) for row_id, values, fields, _ in updates if field in fields]
+        if not changed:
+            continue
+        assignments.append(f"{field} = CASE row_id {' '.join(['WHEN %s THEN %s'] * len(changed))} ELSE {field} END")
+        for row_id, value in changed:
+            params.extend([row_id, value])
+    assignments.append("row_version = row_version + 1")
+    where, where_params = _versioned_rows_clause([(row_id, row_version) for row_id, _, _, row_version in updates])
+    query = f"UPDATE tbl_courses SET {', '.join(assignments)} WHERE {where}"
+    return query, params + where_params
+
+class EditConflict(Exception):
+    """Raised inside a grid save when a row was changed or deleted by someone else since it was loaded"""
+
+def find_course_conflicts(cursor, expected):
+    """
+    Compare expected {row_id: row_version} with the committed rows
+    Returns a DataFrame of the server's current values for the rows that moved on,
+    with status 'changed' or 'deleted'
+    """
+    current = fetch_current_courses(cursor, list(expected))
+    rows = []
+    for row_id, row_version in expected.items():
+        row = current.get(row_id)
+        if row is None:
+            rows.append({'row_id': row_id, 'status': 'deleted'})
+        elif row['row_version'] != row_version:
+            rows.append({**row, 'status': 'changed'})
+    return pd.DataFrame(rows, columns=['status', *COURSE_COLUMNS.split(', ')])
+
+def save_course_edits(inserts, updates, deletes):
+    """
+    Apply a batch of grid edits in one transaction: one statement per kind and chunk
+    inserts: (code, name, credits, sessions) tuples
+    updates: (row_id, (code, name, credits, sessions), changed field names, row_version)
+    deletes: (row_id, row_version) pairs
+    Nothing is written unless every statement succeeds and every updated or deleted
+    row is still at the version the grid loaded
+    Returns (success, message, conflicts): conflicts is a DataFrame of the server's
+    values for the rows that moved on (see find_course_conflicts), else None
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(deletes), DELETE_BATCH_SIZE):
+                batch = deletes[start:start + DELETE_BATCH_SIZE]
+                where, params = _versioned_rows_clause(batch)
+                log_course_changes(cursor, 'delete', where, params)
+                cursor.execute(f"DELETE FROM tbl_courses WHERE {where}", params)
+                if cursor.rowcount != len(batch):
+                    raise EditConflict()
+            for start in range(0, len(updates), DELETE_BATCH_SIZE):
+                batch = updates[start:start + DELETE_BATCH_SIZE]
+                cursor.execute(*_bulk_update_query(batch))
+                if cursor.rowcount != len(batch):
+                    raise EditConflict()
+                row_ids = [row_id for row_id, _, _, _ in batch]
+                log_course_changes(cursor, 'update', "row_id IN (%s)" % ','.join(['%s'] * len(row_ids)), row_ids)
+            if inserts:
+                cursor.executemany(INSERT_COURSE_QUERY.format(table='tbl_courses'), inserts)
+                for start in range(0, len(inserts), DELETE_BATCH_SIZE):
+                    codes = [row[0] for row in inserts[start:start + DELETE_BATCH_SIZE]]
+                    log_course_changes(cursor, 'insert', "course_code IN (%s)" % ','.join(['%s'] * len(codes)), codes)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, f"Saved {len(inserts)} new, {len(updates)} changed and {len(deletes)} deleted course(s)", None
+        except EditConflict:
+            conn.rollback()
+            expected = dict(deletes)
+            expected.update({row_id: row_version for row_id, _, _, row_version in updates})
+            try:
+                conflicts = find_course_conflicts(cursor, expected)
+            except DB_ERRORS:
+                conflicts = None
+            conn.close()
+            return False, "No changes saved: some rows were changed or deleted by someone else since you loaded them", conflicts
+        except DB_ERRORS as e:
+            conn.rollback()
+            conn.close()
+            return False, f"No changes saved: {e}", None
+    return False, "Database connection failed", None
+
+def iter_course_rows(filters=None, fetch_size=None):
+    """Stream matching courses (export columns only) from a server-side cursor, fetch_size rows at a time"""
+    fetch_size = fetch_size or EXPORT_CONFIG['fetch_size']
+    where, params = build_course_filter(filters)
+    conn = get_read_connection(get_table_version().value)
+    try:
+        # Unbuffered cursor: rows stay on the server until fetched
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(EXPORT_COLUMNS)} FROM tbl_courses WHERE 1 = 1{where} ORDER BY row_id",
+            params
+        )
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+    finally:
+        conn.close()
+
+def _write_csv_export(path, batches, compress):
+    count = 0
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+def _write_xlsx_export(path, batches):
+    count = 0
+    # Write-only workbooks stream rows to disk instead of keeping cells in memory
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Courses')
+    sheet.append(EXPORT_COLUMNS)
+    for rows in batches:
+        for row in rows:
+            sheet.append(row)
+        count += len(rows)
+    workbook.save(path)
+    return count
+
+def _write_parquet_export(path, batches, compress):
+    count = 0
+    schema = pa.schema([
+        ('course_code', pa.string()),
+        ('course_name', pa.string()),
+        ('course_credits', pa.int8()),
+        ('sessions_per_week', pa.int8())
+    ])
+    with pq.ParquetWriter(path, schema, compression='gzip' if compress else 'snappy') as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(rows)
+    return count
+
+def _take_temp_file(path):
+    """Read a finished temporary file into memory and delete it, so no file outlives the session"""
+    try:
+        with open(path, 'rb') as source:
+            return source.read()
+    finally:
+        os.remove(path)
+
+@instrumented("export.courses")
+def export_courses(fmt, compress=False, filters=None):
+    """
+    Stream the (filtered) catalogue into a temporary export file, then load it and remove the file
+    fmt: 'csv', 'xlsx' or 'parquet'; compress gzips the file (Parquet uses its gzip codec instead)
+    Returns a dict with data (the file's bytes), file_name, mime and rows
+    """
+    fd, path = tempfile.mkstemp(prefix='courses_', suffix=f'.{fmt}')
+    os.close(fd)
+    file_name = f"courses.{fmt}"
+    mime = EXPORT_FORMATS[fmt][1]
+    try:
+        batches = iter_course_rows(filters)
+        if fmt == 'csv':
+            count = _write_csv_export(path, batches, compress)
+        elif fmt == 'xlsx':
+            count = _write_xlsx_export(path, batches)
+        elif fmt == 'parquet':
+            if pq is None:
+                raise ValueError("Parquet export needs the pyarrow package")
+            count = _write_parquet_export(path, batches, compress)
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        
+        if compress and fmt == 'xlsx':
+            with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            path += '.gz'
+        if compress and fmt != 'parquet':
+            file_name += '.gz'
+            mime = "application/gzip"
+    except Exception:
+        os.remove(path)
+        raise
+    return {'data': _take_temp_file(path), 'file_name': file_name, 'mime': mime, 'rows': count}
+
+def render_export_panel(filters=None):
+    """Build an export file only when asked, then offer it for download"""
+    formats = [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pq is not None]
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        fmt = st.selectbox("Export format", formats, format_func=lambda f: EXPORT_FORMATS[f][0], key="export_format")
+    with col2:
+        compress = st.checkbox("gzip", key="export_gzip", help="Compress the export file")
+    with col3:
+        prepare = st.button("📦 Prepare Export", use_container_width=True)
+    
+    if prepare:
+        st.session_state.pop('export_file', None)
+        try:
+            with st.spinner("Exporting courses..."):
+                st.session_state.export_file = export_courses(fmt, compress, filters)
+        except (*DB_ERRORS, ValueError) as e:
+            st.error(f"Error exporting courses: {e}")
+    
+    export = st.session_state.get('export_file')
+    if export:
+        st.download_button(
+            label=f"📥 Download {export['file_name']} ({export['rows']} courses)",
+            data=export['data'],
+            file_name=export['file_name'],
+            mime=export['mime']
+        )
+
+def resolve_course_columns(columns):
+    """Map each course field to the spreadsheet column that supplies it (last match wins)"""
+    resolved = {}
+    for col in columns:
+        name = str(col).lower().strip()
+        for field, aliases in COLUMN_ALIASES.items():
+            if name in aliases:
+                resolved[field] = col
+    return resolved
+
+def _text_column(df, col):
+    """Return a column as stripped strings, with blanks for missing cells"""
+    if col is None:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[col]
+    if not pd.api.types.is_string_dtype(values):
+        values = values.where(values.notna(), '').astype(str)
+    return values.fillna('').str.strip()
+
+def _number_column(df, col):
+    """Return (raw values, numeric values truncated like int(), missing mask) for a column"""
+    if col is None:
+        raw = pd.Series(np.nan, index=df.index, dtype=object)
+    else:
+        raw = df[col]
+    missing = raw.isna()
+    if not pd.api.types.is_numeric_dtype(raw):
+        missing |= raw.astype(str).str.strip().eq('')
+    numbers = np.trunc(pd.to_numeric(raw, errors='coerce'))
+    return raw, numbers, missing
+
+def _value_messages(prefix, raw, mask):
+    """Per-row messages ending with the offending value, built only for the failing rows"""
+    messages = pd.Series(prefix, index=raw.index, dtype=object)
+    if mask.any():
+        messages[mask] = prefix + raw[mask].astype(str)
+    return messages
+
+# Validation rules in priority order: (rule, message, blocks import)
+# Messages are formatted with CONSTRAINTS; invalid_* messages also get the offending value
+VALIDATION_RULES = [
+    ('missing_code', "Missing course code", True),
+    ('missing_name', "Missing course name", True),
+    ('missing_credits', "Missing course credits", True),
+    ('invalid_credits', "Invalid course credits: ", True),
+    ('missing_sessions', "Missing sessions per week", True),
+    ('invalid_sessions', "Invalid sessions per week: ", True),
+    ('credits_range', "Credits must be between {course_credits[min_value]} and {course_credits[max_value]}", True),
+    ('sessions_range', "Sessions must be between {sessions_per_week[min_value]} and {sessions_per_week[max_value]}", True),
+    ('code_too_long', "Course code longer than {course_code[max_length]} characters", True),
+    ('name_too_long', "Course name longer than {course_name[max_length]} characters", True),
+    ('duplicate_in_file', "Course code appears earlier in the file", False),
+    ('duplicate_in_db', "Course code already exists in the database", False)
+]
+
+# Duplicate rules that block per import mode: the unique key on course_code rejects those rows
+MODE_BLOCKING_RULES = {
+    'append': ('duplicate_in_file', 'duplicate_in_db'),
+    'upsert': ('duplicate_in_file',),
+    'replace': ('duplicate_in_file',)
+}
+
+def blocking_rules(mode=None):
+    """Return the rules that skip a row, including the duplicate rules the import mode adds"""
+    extra = MODE_BLOCKING_RULES.get(mode, ())
+    return [rule for rule, _, blocks in VALIDATION_RULES if blocks or rule in extra]
+
+def evaluate_course_rules(df, seen_codes=None, existing_codes=None):
+    """
+    Run every validation rule over a frame as whole-column checks
+    seen_codes: optional set of casefolded codes from earlier chunks of the same file (updated in place)
+    existing_codes: optional unique pd.Index of casefolded codes already in the database
+    Codes are compared casefolded, as the case-insensitive unique key on course_code does
+    Returns (fields, failures, messages, sheet_rows): cleaned field Series, a boolean DataFrame
+    with one column per rule, the message for each rule, and the sheet row numbers
+    """
+    columns = resolve_course_columns(df.columns)
+    codes = _text_column(df, columns.get('course_code'))
+    names = _text_column(df, columns.get('course_name'))
+    raw_credits, credits, credits_missing = _number_column(df, columns.get('course_credits'))
+    raw_sessions, sessions, sessions_missing = _number_column(df, columns.get('sessions_per_week'))
+    limits = CONSTRAINTS
+
+    missing_code = codes.eq('') | codes.eq('nan')
+    folded_codes = codes.str.casefold()
+    if seen_codes is not None:
+        # Probe the set per code: isin() would copy the whole (growing) set for every chunk
+        seen = np.array([code in seen_codes for code in folded_codes.tolist()], dtype=bool)
+        duplicate_in_file = ~missing_code & (folded_codes.duplicated() | seen)
+        seen_codes.update(folded_codes[~missing_code].tolist())
+    else:
+        duplicate_in_file = pd.Series(False, index=df.index)
+    if existing_codes is not None:
+        # The index builds its hash table once and reuses it for every chunk
+        duplicate_in_db = ~missing_code & (existing_codes.get_indexer(folded_codes.to_numpy()) >= 0)
+    else:
+        duplicate_in_db = pd.Series(False, index=df.index)
+
+    failures = pd.DataFrame({
+        'missing_code': missing_code,
+        'missing_name': names.eq('') | names.eq('nan'),
+        'missing_credits': credits_missing,
+        'invalid_credits': ~credits_missing & credits.isna(),
+        'missing_sessions': sessions_missing,
+        'invalid_sessions': ~sessions_missing & sessions.isna(),
+        'credits_range': (credits < limits['course_credits']['min_value']) | (credits > limits['course_credits']['max_value']),
+        'sessions_range': (sessions < limits['sessions_per_week']['min_value']) | (sessions > limits['sessions_per_week']['max_value']),
+        'code_too_long': codes.str.len() > limits['course_code']['max_length'],
+        'name_too_long': names.str.len() > limits['course_name']['max_length'],
+        'duplicate_in_file': duplicate_in_file,
+        'duplicate_in_db': duplicate_in_db
+    }, index=df.index)
+
+    messages = {rule: message.format(**limits) for rule, message, _ in VALIDATION_RULES}
+    messages['invalid_credits'] = _value_messages(messages['invalid_credits'], raw_credits, failures['invalid_credits'])
+    messages['invalid_sessions'] = _value_messages(messages['invalid_sessions'], raw_sessions, failures['invalid_sessions'])
+
+    fields = {'course_code': codes, 'course_name': names, 'course_credits': credits, 'sessions_per_week': sessions}
+    # Sheet row numbers: header is row 1 and the index counts data rows from 0
+    sheet_rows = pd.Series(df.index, index=df.index) + 2
+    return fields, failures, messages, sheet_rows
+
+def first_failure_messages(failures, messages, rules):
+    """Return, per row, the message of the first rule in rules that the row breaks ('' if none)"""
+    return pd.Series(
+        np.select(
+            [failures[rule].to_numpy(dtype=bool) for rule in rules],
+            [np.asarray(messages[rule], dtype=object) for rule in rules],
+            default=''
+        ),
+        index=failures.index
+    )
+
+def prepare_course_rows(df, mode=None, seen_codes=None, existing_codes=None):
+    """
+    Validate an import frame with whole-column checks
+    mode, seen_codes and existing_codes: skip the rows the mode's duplicate rules block
+    (see evaluate_course_rules), so a batch is not rejected for a duplicate code
+    Returns (rows, row_numbers, errors): insertable tuples, their sheet row numbers,
+    and one message per rejected row
+    """
+    fields, failures, messages, sheet_rows = evaluate_course_rules(df, seen_codes, existing_codes)
+    blocking = blocking_rules(mode)
+    reasons = first_failure_messages(failures, messages, blocking)
+
+    failed = reasons.ne('')
+    errors = [f"Row {row}: {reason}" for row, reason in zip(sheet_rows[failed], reasons[failed])]
+
+    valid = ~failed
+    rows = list(zip(
+        fields['course_code'][valid].tolist(),
+        fields['course_name'][valid].tolist(),
+        fields['course_credits'][valid].astype(int).tolist(),
+        fields['sessions_per_week'][valid].astype(int).tolist()
+    ))
+    return rows, sheet_rows[valid].tolist(), errors
+
+def fetch_course_codes():
+    """Return the casefolded course codes in the table as a unique pd.Index, from the shared catalogue"""
+    codes = get_course_catalogue().get(get_table_version().value)['course_code']
+    # Categories can still hold codes of replaced or deleted rows, so take the values in use
+    return pd.Index(codes.astype(str).str.casefold()).unique()
+
+@instrumented("import.dry_run")
+def dry_run_import(chunks, mode='append', report_format='csv', errors_only=False, progress=None, total_rows=None):
+    """
+    Validate an upload without writing anything to tbl_courses
+    mode: the import mode the file is meant for; it decides which duplicate rules skip a row
+    Writes an annotated report (the uploaded columns, one column per rule and an errors summary)
+    chunk by chunk to a temporary CSV or XLSX file, then loads it and removes the file
+    Returns a summary dict: rows, valid, invalid, rule_counts and the report data/file_name/mime
+    """
+    existing_codes = fetch_course_codes()
+    seen_codes = set()
+    rule_names = [rule for rule, _, _ in VALIDATION_RULES]
+    blocking = blocking_rules(mode)
+    rule_counts = dict.fromkeys(rule_names, 0)
+    total = valid = 0
+
+    fd, path = tempfile.mkstemp(prefix='course_validation_', suffix=f'.{report_format}')
+    os.close(fd)
+    workbook = sheet = None
+    if report_format == 'xlsx':
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet('Validation')
+    header_written = False
+
+    try:
+        for chunk in chunks:
+            fields, failures, messages, sheet_rows = evaluate_course_rules(chunk, seen_codes, existing_codes)
+            total += len(chunk)
+            valid += int((~failures[blocking].any(axis=1)).sum())
+            rule_counts_chunk = failures[rule_names].sum()
+            for rule in rule_names:
+                rule_counts[rule] += int(rule_counts_chunk[rule])
+
+            summary = pd.Series('', index=chunk.index, dtype=object)
+            for rule in rule_names:
+                if rule_counts_chunk[rule]:
+                    summary = summary + np.where(failures[rule], messages[rule] + '; ', '')
+            # Assemble the report in one concat; adding columns one at a time copies the frame each time
+            flags = pd.DataFrame(np.where(failures[rule_names].to_numpy(), 'FAIL', ''),
+                                 index=chunk.index, columns=rule_names)
+            report = pd.concat([sheet_rows.rename('row'), chunk, flags, summary.str.rstrip('; ').rename('errors')], axis=1)
+            if errors_only:
+                report = report[failures.any(axis=1)]
+
+            if sheet is not None:
+                if not header_written:
+                    sheet.append([str(column) for column in report.columns])
+                for row in report.itertuples(index=False):
+                    sheet.append([None if pd.isna(value) else value for value in row])
+            else:
+                report.to_csv(path, mode='a', header=not header_written, index=False)
+            header_written = True
+            if progress:
+                progress(total, total_rows)
+        if workbook is not None:
+            workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return {
+        'rows': total,
+        'valid': valid,
+        'invalid': total - valid,
+        'rule_counts': rule_counts,
+        'data': _take_temp_file(path),
+        'file_name': f"course_validation.{report_format}",
+        'mime': EXPORT_FORMATS[report_format][1]
+    }
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'phpmyadmin',
-    'password': '123',  # Change this to your MySQL password
-    'database': 'test'
-}
+INSERT_COURSE_QUERY = """
+INSERT INTO {table} (course_code, course_name, course_credits, sessions_per_week)
+VALUES (%s, %s, %s, %s)
+"""
 
-# Initialize session state
-if 'refresh' not in st.session_state:
-    st.session_state.refresh = 0
+class ImportCancelled(Exception):
+    """Raised inside an import when its job is cancelled; the current batch is rolled back"""
 
-def get_db_connection():
-    """Create and return a database connection"""
+def _commit_unless_cancelled(conn, cancelled):
+    if cancelled and cancelled():
+        conn.rollback()
+        raise ImportCancelled()
+    conn.commit()
+
+def insert_course_batch(conn, rows, row_numbers, table='tbl_courses', cancelled=None):
+    """
+    Insert rows with one multi-row INSERT and commit
+    If the batch is rejected anyway (prepare_course_rows already drops duplicate codes),
+    retry row by row so only the offending rows are skipped
+    cancelled: optional callable; when it returns True the batch is rolled back and ImportCancelled raised
+    Returns (inserted count, error messages)
+    """
+    query = INSERT_COURSE_QUERY.format(table=table)
+    # Staging tables are logged as a whole when they are swapped in
+    logged = table == 'tbl_courses'
+    cursor = conn.cursor()
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        st.error(f"Error connecting to MySQL: {e}")
+        try:
+            if logged:
+                # Log only the batch's own rows: their ids are above every id in use now (older rows
+                # may share a code while the unique index is deferred), and the codes leave out
+                # rows other writers add meanwhile
+                cursor.execute("SELECT MAX(row_id) FROM tbl_courses")
+                ((last_id,),) = cursor.fetchall()
+            cursor.executemany(query, rows)
+            if logged:
+                codes = [row[0] for row in rows]
+                log_course_changes(cursor, 'insert',
+                                   "row_id > %%s AND course_code IN (%s)" % ','.join(['%s'] * len(codes)),
+                                   (last_id or 0, *codes))
+        except DB_ERRORS:
+            conn.rollback()
+        else:
+            _commit_unless_cancelled(conn, cancelled)
+            return len(rows), []
+        
+        inserted = 0
+        errors = []
+        for row, row_number in zip(rows, row_numbers):
+            try:
+                cursor.execute(query, row)
+                inserted += 1
+            except DB_ERRORS as e:
+                errors.append(f"Row {row_number}: {e}")
+                continue
+            if logged:
+                log_course_changes(cursor, 'insert', "row_id = %s", (cursor.lastrowid,))
+        _commit_unless_cancelled(conn, cancelled)
+        return inserted, errors
+    finally:
+        cursor.close()
+
+def _upload_kind(uploaded_file):
+    """Return 'xlsx', 'xls' or 'csv' from the uploaded file name"""
+    name = getattr(uploaded_file, 'name', '') or ''
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else 'xlsx'
+
+def _iter_xlsx_chunks(uploaded_file, chunk_size, limit=None):
+    """Stream the first worksheet row by row with openpyxl's read-only mode"""
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        width = len(columns)
+        
+        buffer, index, yielded = [], [], 0
+        for sheet_row, values in enumerate(rows, start=2):
+            if limit is not None and yielded + len(buffer) >= limit:
+                break
+            if all(value is None for value in values):
+                continue
+            values = tuple(values[:width])
+            buffer.append(values + (None,) * (width - len(values)))
+            # Index is sheet row - 2 so error messages keep pointing at the right sheet row
+            index.append(sheet_row - 2)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns, index=index)
+                yielded += len(buffer)
+                buffer, index = [], []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+def iter_upload_chunks(uploaded_file, chunk_size=None, limit=None):
+    """Yield an uploaded .xlsx/.csv file as DataFrames of at most chunk_size rows"""
+    chunk_size = chunk_size or IMPORT_CONFIG['chunk_size']
+    if limit is not None:
+        chunk_size = min(chunk_size, limit)
+    uploaded_file.seek(0)
+    kind = _upload_kind(uploaded_file)
+    
+    if kind == 'xlsx':
+        yield from _iter_xlsx_chunks(uploaded_file, chunk_size, limit)
+    elif kind == 'csv':
+        # Read cells as text so codes like 0101 keep their zeros; only empty cells count as missing
+        reader = pd.read_csv(uploaded_file, chunksize=chunk_size, nrows=limit, encoding='utf-8-sig',
+                             dtype=str, keep_default_na=False, na_values=[''])
+        with reader:
+            yield from reader
+    else:
+        # Legacy .xls has no streaming reader; load it once and slice
+        df = pd.read_excel(uploaded_file, nrows=limit, dtype=str, keep_default_na=False, na_values=[''])
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+def read_upload_preview(uploaded_file, rows=None):
+    """Read only the first rows of an upload for preview and header validation"""
+    rows = rows or IMPORT_CONFIG['preview_rows']
+    chunks = list(iter_upload_chunks(uploaded_file, limit=rows))
+    uploaded_file.seek(0)
+    return chunks[0] if chunks else pd.DataFrame()
+
+def estimate_upload_rows(uploaded_file):
+    """Estimate the number of data rows in an upload without parsing it (None if unknown)"""
+    kind = _upload_kind(uploaded_file)
+    try:
+        if kind == 'xlsx':
+            uploaded_file.seek(0)
+            workbook = openpyxl.load_workbook(uploaded_file, read_only=True)
+            try:
+                max_row = workbook.worksheets[0].max_row
+            finally:
+                workbook.close()
+            return max(max_row - 1, 0) if max_row else None
+        if kind == 'csv':
+            # Count over a view of the upload (getvalue() would copy it), 1 MiB at a time
+            with uploaded_file.getbuffer() as buffer:
+                data = np.frombuffer(buffer, dtype=np.uint8)
+                newlines = sum(
+                    int(np.count_nonzero(data[start:start + (1 << 20)] == 10))
+                    for start in range(0, len(data), 1 << 20)
+                )
+                del data  # Release the export so the view can close
+            return max(newlines - 1, 0)
         return None
+    finally:
+        uploaded_file.seek(0)
 
-def create_database_and_table():
-    """Create database and table if they don't exist"""
+def create_staging_table():
+    """
+    Create an empty copy of tbl_courses to load a replace import into; returns its name
+    Its row ids continue after every id tbl_courses has used (live or in the change log),
+    so an editor still holding a replaced row can never match a new course by row_id and row_version
+    """
+    staging_table = f"tbl_courses_staging_{uuid.uuid4().hex[:8]}"
+    backend = get_backend()
+    conn = get_connection_pool().get_connection()
     try:
-        # Connect without database
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
-        )
         cursor = conn.cursor()
-        
-        # Create database
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
-        cursor.execute(f"USE {DB_CONFIG['database']}")
-        
-        # Create table
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS tbl_courses (
-            row_id INT AUTO_INCREMENT PRIMARY KEY,
-            course_code VARCHAR(10) NOT NULL,
-            course_name VARCHAR(50) NOT NULL,
-            course_credits INT NOT NULL,
-            sessions_per_week INT NOT NULL
-        )
-        """
-        cursor.execute(create_table_query)
+        backend.create_table_like(cursor, staging_table, 'tbl_courses')
+        backend.seed_row_ids(cursor, staging_table, _last_row_id(cursor) + 1)
         conn.commit()
         cursor.close()
+    finally:
         conn.close()
-        return True
-    except Error as e:
-        st.error(f"Error creating database/table: {e}")
-        return False
+    return staging_table
 
-def fetch_all_courses():
-    """Fetch all courses from database"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            query = "SELECT row_id, course_code, course_name, course_credits, sessions_per_week FROM tbl_courses ORDER BY row_id"
-            df = pd.read_sql(query, conn)
-            conn.close()
-            return df
-        except Error as e:
-            st.error(f"Error fetching data: {e}")
-            conn.close()
-            return pd.DataFrame()
-    return pd.DataFrame()
-
-def insert_course(course_code, course_name, course_credits, sessions_per_week):
-    """Insert a new course record"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            query = """
-            INSERT INTO tbl_courses (course_code, course_name, course_credits, sessions_per_week)
-            VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(query, (course_code, course_name, course_credits, sessions_per_week))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True, "Course added successfully!"
-        except Error as e:
-            conn.close()
-            return False, f"Error inserting course: {e}"
-    return False, "Database connection failed"
+def _last_row_id(cursor, *tables):
+    """Return the highest row_id tbl_courses has used, live or in the change log (and in tables)"""
+    last_id = 0
+    for table in ('tbl_courses', 'tbl_course_changes', *tables):
+        cursor.execute(f"SELECT MAX(row_id) FROM {table}")
+        ((row_id,),) = cursor.fetchall()
+        last_id = max(last_id, row_id or 0)
+    return last_id
 
-def update_course(row_id, course_code, course_name, course_credits, sessions_per_week):
-    """Update an existing course record"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            query = """
-            UPDATE tbl_courses 
-            SET course_code = %s, course_name = %s, course_credits = %s, sessions_per_week = %s
-            WHERE row_id = %s
-            """
-            cursor.execute(query, (course_code, course_name, course_credits, sessions_per_week, row_id))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True, "Course updated successfully!"
-        except Error as e:
-            conn.close()
-            return False, f"Error updating course: {e}"
-    return False, "Database connection failed"
+def swap_in_staging_table(staging_table):
+    """
+    Atomically replace tbl_courses with the staging table and drop the old data
+    The change log gets a reset followed by every new row
+    """
+    old_table = staging_table.replace('_staging_', '_old_')
+    conn = get_connection_pool().get_connection()
+    try:
+        cursor = conn.cursor()
+        last_row_id = _last_row_id(cursor)
+        get_backend().swap_tables(cursor, 'tbl_courses', staging_table, old_table)
+        # MySQL's RENAME commits on its own; if the log below does not, the old table is left
+        # behind and recover_unlogged_swaps() logs the swap on the next start
+        log_course_reset(cursor, last_row_id)
+        log_course_changes(cursor, 'insert', "1 = 1")
+        conn.commit()
+        cursor.execute(f"DROP TABLE IF EXISTS {old_table}")
+        cursor.close()
+    finally:
+        conn.close()
 
-def delete_course(row_id):
-    """Delete a course record"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            query = "DELETE FROM tbl_courses WHERE row_id = %s"
-            cursor.execute(query, (row_id,))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True, "Course deleted successfully!"
-        except Error as e:
-            conn.close()
-            return False, f"Error deleting course: {e}"
-    return False, "Database connection failed"
+def recover_unlogged_swaps(cursor):
+    """Log the swaps whose old table is still there (their change-log entries may not have committed)"""
+    if get_backend().name == 'sqlite':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'tbl_courses_old_%'")
+    else:
+        cursor.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name LIKE 'tbl_courses_old_%'"
+        )
+    for (old_table,) in cursor.fetchall():
+        # Logging a swap twice is harmless: an extra reset only makes readers reload
+        log_course_reset(cursor, _last_row_id(cursor, old_table))
+        log_course_changes(cursor, 'insert', "1 = 1")
+        cursor.execute(f"DROP TABLE {old_table}")
 
-def delete_multiple_courses(row_ids):
-    """Delete multiple course records"""
-    conn = get_db_connection()
-    if conn:
+def drop_staging_table(staging_table):
+    """Discard a staging table left by a failed replace import (best effort)"""
+    try:
+        conn = get_connection_pool().get_connection()
         try:
             cursor = conn.cursor()
-            query = "DELETE FROM tbl_courses WHERE row_id IN (%s)" % ','.join(['%s'] * len(row_ids))
-            cursor.execute(query, row_ids)
-            conn.commit()
+            cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
             cursor.close()
+        finally:
             conn.close()
-            return True, f"{len(row_ids)} course(s) deleted successfully!"
-        except Error as e:
-            conn.close()
-            return False, f"Error deleting courses: {e}"
-    return False, "Database connection failed"
+    except DB_ERRORS:
+        pass
 
-def import_courses_from_excel(df, mode='append'):
+def import_courses_from_excel(df, mode='append', progress=None, total_rows=None, cancelled=None):
     """
     Import courses from Excel dataframe
-    mode: 'append' - add to existing data, 'replace' - clear table first
+    df: a DataFrame, or an iterable of DataFrame chunks (see iter_upload_chunks)
+    mode: 'append' - add to existing data, 'replace' - load into a staging table
+    and swap it in for tbl_courses once every row is in
+    progress: optional callback(rows_processed, total_rows) called after each batch;
+    total_rows is None when the size of a streamed upload is unknown
+    cancelled: optional callable checked before each commit; raises ImportCancelled
+    (earlier append batches stay committed, a replace import leaves the live table untouched)
     """
+    if isinstance(df, pd.DataFrame):
+        chunk_size = IMPORT_CONFIG['chunk_size']
+        total_rows = len(df)
+        chunks = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+    else:
+        chunks = df
+    
     conn = get_db_connection()
     if conn:
+        staging_table = None
         try:
-            cursor = conn.cursor()
-            
-            # If replace mode, clear existing data
+            # Replace mode loads into a private copy; the live table is untouched until the swap
             if mode == 'replace':
-                cursor.execute("DELETE FROM tbl_courses")
-                conn.commit()
+                with timed("import.staging"):
+                    staging_table = create_staging_table()
+            target_table = staging_table or 'tbl_courses'
+            # Codes the unique key would reject are skipped up front, keeping batches whole
+            seen_codes = set()
+            existing_codes = fetch_course_codes() if mode == 'append' else None
             
-            # Prepare data for insertion
             success_count = 0
             error_count = 0
             errors = []
+            batch_size = IMPORT_CONFIG['batch_size']
+            max_errors = IMPORT_CONFIG['max_errors']
             
-            for index, row in df.iterrows():
-                try:
-                    # Handle different possible column names
-                    course_code = None
-                    course_name = None
-                    course_credits = None
-                    sessions_per_week = None
-                    
-                    # Try to find course_code column (case-insensitive)
-                    for col in df.columns:
-                        if col.lower().strip() in ['course_code', 'coursecode', 'code']:
-                            course_code = str(row[col]).strip()
-                        if col.lower().strip() in ['course_name', 'coursename', 'name']:
-                            course_name = str(row[col]).strip()
-                        elif col.lower().strip() in ['course_credits', 'credits', 'credit']:
-                            course_credits = int(row[col])
-                        elif col.lower().strip() in ['sessions_per_week', 'sessions', 'sessionsperweek']:
-                            sessions_per_week = int(row[col])
-                    
-                    # Validate data
-                    if not course_code or pd.isna(course_code) or course_code == 'nan':
-                        errors.append(f"Row {index + 2}: Missing course code")
-                        error_count += 1
-                        continue
-                    
-                    # Validate data
-                    if not course_name or pd.isna(course_name) or course_name == 'nan':
-                        errors.append(f"Row {index + 2}: Missing course name")
-                        error_count += 1
-                        continue
-
-                    if course_credits is None or pd.isna(course_credits):
-                        errors.append(f"Row {index + 2}: Missing course credits")
-                        error_count += 1
-                        continue
-                    
-                    if sessions_per_week is None or pd.isna(sessions_per_week):
-                        errors.append(f"Row {index + 2}: Missing sessions per week")
-                        error_count += 1
-                        continue
-                    
-                    # Validate ranges
-                    if course_credits < 1 or course_credits > 10:
-                        errors.append(f"Row {index + 2}: Credits must be between 1 and 10")
-                        error_count += 1
-                        continue
-                    
-                    if sessions_per_week < 1 or sessions_per_week > 10:
-                        errors.append(f"Row {index + 2}: Sessions must be between 1 and 7")
-                        error_count += 1
-                        continue
-                    
-                    # Insert the record
-                    query = """
-                    INSERT INTO tbl_courses (course_code, course_name, course_credits, sessions_per_week)
-                    VALUES (%s, %s, %s, %s)
-                    """
-                    cursor.execute(query, (course_code, course_name, course_credits, sessions_per_week))
-                    success_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {index + 2}: {str(e)}")
-                    error_count += 1
-                    continue
+            def record_errors(messages):
+                errors.extend(messages[:max(max_errors - len(errors), 0)])
+                return len(messages)
+            
+            # Validate a bounded chunk at a time, then insert its valid rows in batches
+            for chunk in timed_chunks(chunks, "import.read"):
+                with timed("import.validate"):
+                    rows, row_numbers, chunk_errors = prepare_course_rows(chunk, mode, seen_codes, existing_codes)
+                error_count += record_errors(chunk_errors)
+                for start in range(0, len(rows), batch_size):
+                    with timed("import.insert"):
+                        inserted, batch_errors = insert_course_batch(
+                            conn, rows[start:start + batch_size], row_numbers[start:start + batch_size],
+                            table=target_table, cancelled=cancelled
+                        )
+                    success_count += inserted
+                    error_count += record_errors(batch_errors)
+                    if progress:
+                        progress(success_count + error_count, total_rows)
+                if progress and not rows:
+                    progress(success_count + error_count, total_rows)
             
-            conn.commit()
-            cursor.close()
             conn.close()
+            if staging_table:
+                with timed("import.swap"):
+                    swap_in_staging_table(staging_table)
+                staging_table = None
+            mark_courses_changed()
             
             return True, success_count, error_count, errors
             
-        except Error as e:
-            conn.close()
+        except (*DB_ERRORS, ImportCancelled) as e:
+            if not staging_table:
+                # Append mode commits batch by batch, so earlier batches are already in
+                mark_courses_changed()
+            if isinstance(e, ImportCancelled):
+                raise
             return False, 0, 0, [f"Database error: {e}"]
+        finally:
+            conn.close()
+            if staging_table:
+                drop_staging_table(staging_table)
     return False, 0, 0, ["Database connection failed"]
 
+def fetch_existing_courses(cursor, codes):
+    """Look up current values for a batch of codes via the unique key; returns {code (casefolded): row}"""
+    if not codes:
+        return {}
+    cursor.execute(
+        "SELECT course_code, course_name, course_credits, sessions_per_week FROM tbl_courses "
+        "WHERE course_code IN (%s)" % ','.join(['%s'] * len(codes)),
+        codes
+    )
+    # course_code compares case-insensitively (MySQL collation, SQLite NOCASE), so match it the same way here
+    return {code.casefold(): (name, credits, sessions) for code, name, credits, sessions in cursor.fetchall()}
+
+def upsert_courses_from_excel(df, progress=None, total_rows=None, cancelled=None):
+    """
+    Merge courses into tbl_courses keyed on course_code
+    New codes are inserted, changed rows updated and unchanged rows skipped without a write
+    df, progress, total_rows and cancelled work as for import_courses_from_excel
+    Returns (success, counts, error_count, errors) where counts has inserted/updated/unchanged
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not has_unique_course_codes():
+        return False, counts, 0, ["Merge imports need unique course codes; remove duplicate codes first"]
+    
+    if isinstance(df, pd.DataFrame):
+        chunk_size = IMPORT_CONFIG['chunk_size']
+        total_rows = len(df)
+        chunks = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+    else:
+        chunks = df
+    
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            error_count = 0
+            errors = []
+            batch_size = IMPORT_CONFIG['batch_size']
+            max_errors = IMPORT_CONFIG['max_errors']
+            # A code repeated in the file: the first occurrence is merged, later ones are reported
+            seen_codes = set()
+            
+            for chunk in timed_chunks(chunks, "import.read"):
+                with timed("import.validate"):
+                    rows, row_numbers, chunk_errors = prepare_course_rows(chunk, 'upsert', seen_codes)
+                errors.extend(chunk_errors[:max(max_errors - len(errors), 0)])
+                error_count += len(chunk_errors)
+                
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    with timed("import.lookup"):
+                        existing = fetch_existing_courses(cursor, [row[0] for row in batch])
+                    changed = []
+                    written = {'insert': [], 'update': []}
+                    for row in batch:
+                        current = existing.get(row[0].casefold())
+                        if current is None:
+                            counts['inserted'] += 1
+                            changed.append(row)
+                            written['insert'].append(row[0])
+                        elif current != row[1:]:
+                            counts['updated'] += 1
+                            changed.append(row)
+                            written['update'].append(row[0])
+                        else:
+                            counts['unchanged'] += 1
+                    with timed("import.upsert"):
+                        if changed:
+                            cursor.executemany(get_backend().upsert_query, changed)
+                        for op, codes in written.items():
+                            if codes:
+                                log_course_changes(cursor, op, "course_code IN (%s)" % ','.join(['%s'] * len(codes)), codes)
+                        _commit_unless_cancelled(conn, cancelled)
+                    if progress:
+                        progress(sum(counts.values()) + error_count, total_rows)
+                if progress and not rows:
+                    progress(sum(counts.values()) + error_count, total_rows)
+            
+            cursor.close()
+            conn.close()
+            mark_courses_changed()
+            return True, counts, error_count, errors
+        
+        except (*DB_ERRORS, ImportCancelled) as e:
+            conn.close()
+            # Earlier batches are already committed
+            mark_courses_changed()
+            if isinstance(e, ImportCancelled):
+                raise
+            return False, counts, 0, [f"Database error: {e}"]
+    return False, counts, 0, ["Database connection failed"]
+
+IMPORT_MODES = {
+    'append': "Append",
+    'upsert': "Merge",
+    'replace': "Replace"
+}
+
+class ImportJob:
+    """Progress and outcome of one background import, readable from any session"""
+
+    def __init__(self, file_name, mode, total_rows):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_name = file_name
+        self.mode = mode
+        self.total_rows = total_rows
+        self.status = 'queued'      # queued -> running -> done / failed / cancelled
+        self.processed = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.counts = None
+        self.errors = []
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    def update_progress(self, processed, total_rows):
+        self.processed = processed
+        if total_rows:
+            self.total_rows = max(total_rows, processed)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def rate(self):
+        """Rows processed per second so far"""
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Estimated seconds left, or None when unknown"""
+        rate = self.rate()
+        if self.finished or not self.total_rows or not rate:
+            return None
+        return max(self.total_rows - self.processed, 0) / rate
+
+def run_import_job(job, path):
+    """Worker body: stream the spooled upload into the database, recording progress on the job"""
+    job.status = 'running'
+    job.started_at = time.time()
+    try:
+        if job.cancel_event.is_set():
+            raise ImportCancelled()
+        with open(path, 'rb') as upload, closing(iter_upload_chunks(upload)) as chunks:
+            options = dict(progress=job.update_progress, total_rows=job.total_rows,
+                           cancelled=job.cancel_event.is_set)
+            # Imports take the write lane, so they queue behind each other, never behind reads
+            write = get_data_layer().run_write
+            if job.mode == 'upsert':
+                success, job.counts, job.error_count, job.errors = write(upsert_courses_from_excel, chunks, **options)
+                job.success_count = job.counts['inserted'] + job.counts['updated']
+            else:
+                success, job.success_count, job.error_count, job.errors = write(
+                    import_courses_from_excel, chunks, job.mode, **options
+                )
+        job.status = 'done' if success else 'failed'
+    except ImportCancelled:
+        job.status = 'cancelled'
+    except Exception as e:
+        job.errors = [f"Import failed: {e}"]
+        job.status = 'failed'
+    finally:
+        job.finished_at = time.time()
+        os.remove(path)
+        elapsed = job.finished_at - job.started_at
+        record_timing(f"import.job.{job.mode}", elapsed)
+        log_perf_event('import', job_id=job.job_id, mode=job.mode, status=job.status,
+                       rows=job.processed, errors=job.error_count, elapsed=elapsed, rows_per_sec=job.rate())
+
+class ImportJobRegistry:
+    """Background import queue shared by all sessions of this server process"""
+
+    def __init__(self, workers=1, keep_finished=20):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='course-import')
+        self.keep_finished = keep_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, uploaded_file, mode, total_rows=None):
+        """Spool the upload to disk and queue it for import; returns the new ImportJob"""
+        suffix = '.' + _upload_kind(uploaded_file)
+        fd, path = tempfile.mkstemp(prefix='course_import_', suffix=suffix)
+        with os.fdopen(fd, 'wb') as spool:
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, spool)
+        
+        job = ImportJob(uploaded_file.name, mode, total_rows)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self.executor.submit(run_import_job, job, path)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All known jobs, newest first"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted_at, reverse=True)
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.submitted_at)
+        for job in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job.job_id]
+
+@st.cache_resource
+def get_import_jobs():
+    """Return the import job registry shared by all sessions of this server process"""
+    return ImportJobRegistry(IMPORT_CONFIG['workers'])
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+@st.fragment(run_every=1)
+def render_import_job(job_id):
+    """Live status of one import job; refreshes itself every second while the job runs"""
+    job = get_import_jobs().get(job_id)
+    if job is None:
+        st.info("This import job is no longer available.")
+        return
+    
+    st.markdown(f"**{IMPORT_MODES[job.mode]} import of `{job.file_name}`** ({job.status})")
+    if not job.finished:
+        fraction = min(job.processed / job.total_rows, 1.0) if job.total_rows else 0.0
+        detail = f"{job.processed:,}" + (f" / ~{job.total_rows:,}" if job.total_rows else "") + " rows"
+        if job.status == 'running':
+            detail += f" · {job.rate():,.0f} rows/sec"
+            if job.eta() is not None:
+                detail += f" · about {_format_duration(job.eta())} left"
+        else:
+            detail = "Waiting for the running import to finish..."
+        st.progress(fraction, text=detail)
+        if st.button("⛔ Cancel Import", key=f"cancel_{job.job_id}", disabled=job.cancel_event.is_set()):
+            job.cancel()
+        return
+    
+    elapsed = job.finished_at - (job.started_at or job.finished_at)
+    if job.status == 'done':
+        if job.counts:
+            st.success(
+                f"✅ Merged in {_format_duration(elapsed)} ({job.rate():,.0f} rows/sec): "
+                f"{job.counts['inserted']} new, {job.counts['updated']} updated, "
+                f"{job.counts['unchanged']} unchanged"
+            )
+        else:
+            st.success(
+                f"✅ Successfully imported {job.success_count} course(s) in {_format_duration(elapsed)} "
+                f"({job.rate():,.0f} rows/sec)!"
+            )
+        if job.error_count > 0:
+            st.warning(f"⚠️ {job.error_count} row(s) had errors and were skipped")
+            with st.expander("View Errors"):
+                for error in job.errors[:20]:  # Show first 20 errors
+                    st.error(error)
+                if job.error_count > 20:
+                    st.info(f"... and {job.error_count - 20} more errors")
+    elif job.status == 'cancelled':
+        st.warning("Import cancelled. Batches committed before the cancel were kept"
+                   + (" (replace imports leave the existing courses untouched)." if job.mode == 'replace' else "."))
+    else:
+        st.error("❌ Import failed!")
+        for error in job.errors:
+            st.error(error)
+    
+    # Rerun the whole page once so the course grid and statistics pick up the import
+    refreshed = st.session_state.setdefault('refreshed_jobs', set())
+    if job.job_id not in refreshed:
+        refreshed.add(job.job_id)
+        st.rerun(scope="app")
+
+def render_import_jobs():
+    """Show the import this session follows, and let it attach to any other running import"""
+    registry = get_import_jobs()
+    job_id = st.session_state.get('import_job') or st.query_params.get('job')
+    if job_id and registry.get(job_id):
+        st.session_state.import_job = job_id
+        render_import_job(job_id)
+    
+    others = [job for job in registry.jobs() if not job.finished and job.job_id != job_id]
+    if others:
+        labels = {job.job_id: f"{IMPORT_MODES[job.mode]} {job.file_name} ({job.status})" for job in others}
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            selected = st.selectbox("Other imports in progress", list(labels), format_func=labels.get)
+        with col2:
+            if st.button("👁️ Follow", use_container_width=True):
+                st.session_state.import_job = selected
+                st.query_params['job'] = selected
+                st.rerun()
+
 def validate_excel_file(df):
     """Validate if the Excel file has the required structure"""
     if df.empty:
         return False, "Excel file is empty"
     
     # Check for required columns (case-insensitive)
-    columns_lower = [col.lower().strip() for col in df.columns]
+    columns = resolve_course_columns(df.columns)
     
-    has_code = any(col in columns_lower for col in ['course_code', 'coursecode', 'code'])
-    has_name = any(col in columns_lower for col in ['course_name', 'coursename', 'name'])
-    has_credits = any(col in columns_lower for col in ['course_credits', 'credits', 'credit'])
-    has_sessions = any(col in columns_lower for col in ['sessions_per_week', 'sessions', 'sessionsperweek'])
-    
-    if not has_code:
+    if 'course_code' not in columns:
         return False, "Missing column: course_code (or 'code')"
-    if not has_name:
+    if 'course_name' not in columns:
         return False, "Missing column: course_name (or 'name')"
-    if not has_credits:
+    if 'course_credits' not in columns:
         return False, "Missing column: course_credits (or 'credits')"
-    if not has_sessions:
+    if 'sessions_per_week' not in columns:
         return False, "Missing column: sessions_per_week (or 'sessions')"
     
     return True, "Valid format"
 
-def create_sample_excel():
-    """Create a sample Excel file for download"""
-    sample_data = {
-        'course_code': ['CS101', 'MATH201'],
-        'course_name': ['Introduction to Computers', 'Mathematics 1'],
-        'course_credits': [3, 2],
-        'sessions_per_week': [3, 2]
-    }
-    df = pd.DataFrame(sample_data)
+TEMPLATE_VARIANTS = {
+    'sample': "With sample rows",
+    'blank': "Blank (headers only)",
+    'validated': "With sample rows and validation rules"
+}
+TEMPLATE_SAMPLE_ROWS = [
+    ('CS101', 'Introduction to Computers', 3, 3),
+    ('MATH201', 'Mathematics 1', 2, 2)
+]
+
+@st.cache_data(show_spinner=False)
+def build_template(variant, schema_version, constraints_json):
+    """
+    Generate an import template workbook; cached per process on variant, schema version and constraints
+    variant: 'blank', 'sample' or 'validated' (sample rows plus dropdowns and range rules)
+    """
+    constraints = json.loads(constraints_json)
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Courses'
+    sheet.append(EXPORT_COLUMNS)
+    if variant != 'blank':
+        for row in TEMPLATE_SAMPLE_ROWS:
+            sheet.append(row)
     
-    # Create Excel file in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Courses')
+    if variant == 'validated':
+        columns = {field: openpyxl.utils.get_column_letter(i) for i, field in enumerate(EXPORT_COLUMNS, start=1)}
+        for field in ('course_code', 'course_name'):
+            max_length = constraints[field]['max_length']
+            rule = DataValidation(type='textLength', operator='between', formula1='1', formula2=str(max_length),
+                                  allow_blank=False, showErrorMessage=True,
+                                  error=f"{field} must be 1-{max_length} characters")
+            rule.add(f"{columns[field]}2:{columns[field]}1048576")
+            sheet.add_data_validation(rule)
+        for field in ('course_credits', 'sessions_per_week'):
+            low, high = constraints[field]['min_value'], constraints[field]['max_value']
+            choices = ','.join(str(value) for value in range(low, high + 1))
+            rule = DataValidation(type='list', formula1=f'"{choices}"', allow_blank=False,
+                                  showErrorMessage=True, error=f"{field} must be between {low} and {high}")
+            rule.add(f"{columns[field]}2:{columns[field]}1048576")
+            sheet.add_data_validation(rule)
     
+    output = BytesIO()
+    workbook.save(output)
     return output.getvalue()
 
+def get_template(variant='sample'):
+    """Return the cached template workbook bytes for the current schema and constraints"""
+    return build_template(variant, SCHEMA_VERSION, json.dumps(CONSTRAINTS, sort_keys=True))
+
 # Main application
+@st.cache_resource
+def start_metrics_server(host, port):
+    """Serve /metrics in the Prometheus text format from a daemon thread; started once per process"""
+    metrics = get_perf_metrics()
+    pool = get_connection_pool()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text(pool.stats()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep scrapes out of the Streamlit log
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def render_performance_panel(summary):
+    """Sidebar breakdown of where this rerun spent its time, plus process-wide totals"""
+    metrics = get_perf_metrics()
+    with st.sidebar.expander("Performance", expanded=True):
+        if summary:
+            db_time = sum(timing['total'] for name, timing in summary['timings'].items() if name.startswith('db.'))
+            st.markdown(
+                f"**This rerun:** {summary['elapsed'] * 1000:.0f} ms  \n"
+                f"**Database:** {db_time * 1000:.0f} ms, {summary['queries']} queries, {summary['rows']} rows"
+            )
+            # Sections nest (a query.* section includes its db.* time), so totals overlap
+            rerun_df = pd.DataFrame(
+                [(name, timing['count'], timing['total'] * 1000) for name, timing in summary['timings'].items()],
+                columns=["Section", "Calls", "ms"]
+            ).sort_values("ms", ascending=False)
+            st.dataframe(rerun_df, hide_index=True, use_container_width=True,
+                         column_config={"ms": st.column_config.NumberColumn(format="%.1f")})
+        
+        snapshot = metrics.snapshot()
+        st.caption(
+            f"Since server start: {snapshot['counters']['reruns']} reruns, "
+            f"{snapshot['counters']['queries']} queries, {snapshot['counters']['rows_fetched']} rows"
+        )
+        process_df = pd.DataFrame(
+            [(name, timing['count'], timing['total'] / timing['count'] * 1000, timing['max'] * 1000)
+             for name, timing in snapshot['timings'].items()],
+            columns=["Section", "Calls", "Avg ms", "Max ms"]
+        ).sort_values("Calls", ascending=False)
+        st.dataframe(process_df, hide_index=True, use_container_width=True,
+                     column_config={
+                         "Avg ms": st.column_config.NumberColumn(format="%.1f"),
+                         "Max ms": st.column_config.NumberColumn(format="%.1f")
+                     })
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "JSON",
+                json.dumps({'rerun': summary, **snapshot}, indent=2),
+                file_name="course_metrics.json",
+                mime="application/json",
+                use_container_width=True
+            )
+        with col2:
+            st.download_button(
+                "Prometheus",
+                metrics.prometheus_text(get_connection_pool().stats()),
+                file_name="course_metrics.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
+
+# Sidebar pages and the section their render time is recorded under
+PAGES = {
+    "View All Courses": "page.view",
+    "Insert New Course": "page.insert",
+    "Update Course": "page.update",
+    "Delete Course(s)": "page.delete",
+    "Import from Excel": "page.import"
+}
+
 def main():
+    metrics = get_perf_metrics()
+    metrics.start_rerun()
+    if METRICS_CONFIG['port']:
+        try:
+            start_metrics_server(METRICS_CONFIG['host'], METRICS_CONFIG['port'])
+        except OSError as e:
+            st.sidebar.warning(f"Metrics endpoint unavailable: {e}")
+    
     st.title("📚 Course Management System")
     st.markdown("### Excel-like Interface for Managing Courses")
     
@@ -341,43 +3300,39 @@ def main():
         
         # Sidebar for operations
         st.sidebar.header("Operations")
-        operation = st.sidebar.radio(
-            "Select Operation:",
-            ["View All Courses", "Insert New Course", "Update Course", "Delete Course(s)", "Import from Excel"]
-        )
+        operation = st.sidebar.radio("Select Operation:", list(PAGES))
+        page_started = time.perf_counter()
         
         # View All Courses
         if operation == "View All Courses":
             st.subheader("📋 All Courses")
-            df = fetch_all_courses()
+            # Total, filtered count, sidebar statistics and the grid page are independent:
+            # fetch them concurrently, then render from the warmed caches as before
+            filters = course_filters_from_state("view")
+            page_size = st.session_state.get("view_page_size", PAGE_SIZES[1])
+            page = st.session_state.get("view_page", 1)
+            total, *_ = gather_reads(
+                (count_courses,),
+                (count_courses, filters),
+                (fetch_course_stats,),
+                (fetch_courses_page, get_page_anchor(page, page_size, "view", filters), page_size, filters)
+            )
             
-            if not df.empty:
-                st.info(f"Total Courses: {len(df)}")
+            if total > 0:
+                st.info(f"Total Courses: {total}")
                 
-                # Display as editable dataframe
-                st.dataframe(
-                    df,
-                    use_container_width=True,
-                    height=400,
-                    hide_index=True
-                )
+                filters = render_course_filters("view")
+                if render_course_editor("view", filters=filters) == 0:
+                    st.warning("No courses match the current filters.")
                 
                 # Export options
                 st.markdown("---")
-                col1, col2 = st.columns(2)
-                with col1:
-                    df1 = df.drop(columns=['row_id'])
-                    csv = df1.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download as CSV",
-                        data=csv,
-                        file_name="courses.csv",
-                        mime="text/csv"
-                    )
-                with col2:
-                    if st.button("🔄 Refresh Data"):
-                        st.session_state.refresh += 1
-                        st.rerun()
+                render_export_panel(filters)
+                if st.button("🔄 Refresh Data"):
+                    # Pick up changes made outside this app (they bypass the change log)
+                    refresh_course_data()
+                    st.session_state.refresh += 1
+                    st.rerun()
             else:
                 st.warning("No courses found in the database.")
         
@@ -413,31 +3368,25 @@ def main():
             # Show current courses
             st.markdown("---")
             st.markdown("#### Current Courses")
-            df = fetch_all_courses()
-            if not df.empty:
-                st.dataframe(df, use_container_width=True, hide_index=True)
+            render_course_grid("insert")
         
         # Update Course
         elif operation == "Update Course":
             st.subheader("✏️ Update Course")
             
-            df = fetch_all_courses()
-            
-            if not df.empty:
+            if count_courses() > 0:
                 # Select course to update
-                course_options = {f"ID: {row['row_id']} - {row['course_code']}": row['row_id'] 
-                                 for _, row in df.iterrows()}
-                
-                selected_course = st.selectbox(
-                    "Select Course to Update:",
-                    options=list(course_options.keys())
-                )
+                row_id = render_course_picker("Select Course to Update:", "update")
+                current_course = fetch_course(row_id) if row_id is not None else None
                 
-                if selected_course:
-                    row_id = course_options[selected_course]
-                    current_course = df[df['row_id'] == row_id].iloc[0]
+                if current_course:
+                    # Edit the values as first loaded; the update only applies if nobody changed them since
+                    if st.session_state.get('update_base', {}).get('row_id') != row_id:
+                        st.session_state['update_base'] = current_course
+                        st.session_state.pop('update_conflict', None)
+                    base = st.session_state['update_base']
                     
-                    with st.form("update_form"):
+                    with st.form(f"update_form_{row_id}_{base['row_version']}"):
                         st.info(f"Updating Course ID: {row_id}")
                         
                         col1, col2, col3, col4 = st.columns(4)
@@ -445,42 +3394,68 @@ def main():
                         with col1:
                             course_code = st.text_input(
                                 "Course Code*", 
-                                value=current_course['course_code']
+                                value=base['course_code']
                             )
                         with col2:
                             course_name = st.text_input(
                                 "Course Name*", 
-                                value=current_course['course_name']
+                                value=base['course_name']
                             )
                         with col3:
                             course_credits = st.number_input(
                                 "Course Credits*", 
                                 min_value=1, 
                                 max_value=10, 
-                                value=int(current_course['course_credits'])
+                                value=int(base['course_credits'])
                             )
                         with col4:
                             sessions_per_week = st.number_input(
                                 "Sessions Per Week*", 
                                 min_value=1, 
                                 max_value=10, 
-                                value=int(current_course['sessions_per_week'])
+                                value=int(base['sessions_per_week'])
                             )
                         
                         submitted = st.form_submit_button("💾 Update Course", use_container_width=True)
                         
                         if submitted:
                             if course_code.strip():
-                                success, message = update_course(
-                                    row_id, course_code, course_name, course_credits, sessions_per_week
+                                success, message, current = update_course(
+                                    row_id, course_code, course_name, course_credits, sessions_per_week,
+                                    int(base['row_version'])
                                 )
                                 if success:
+                                    st.session_state.pop('update_base', None)
+                                    st.session_state.pop('update_conflict', None)
                                     st.success(message)
                                     st.rerun()
                                 else:
                                     st.error(message)
+                                    if current is not None:
+                                        st.session_state['update_conflict'] = {
+                                            'yours': (course_code, course_name, course_credits, sessions_per_week),
+                                            'server': current
+                                        }
                             else:
                                 st.error("Course Code is required!")
+                    
+                    conflict = st.session_state.get('update_conflict')
+                    if conflict:
+                        st.warning("⚠️ Someone else changed this course while you were editing it:")
+                        st.dataframe(
+                            pd.DataFrame({
+                                "Field": ["Course Code", "Course Name", "Credits", "Sessions/Week"],
+                                "Your values": [str(value) for value in conflict['yours']],
+                                "Current values": [str(conflict['server'][field]) for field in EXPORT_COLUMNS]
+                            }),
+                            hide_index=True,
+                            use_container_width=True
+                        )
+                        if st.button("🔄 Edit the current values", use_container_width=True):
+                            # Start over from the server's version; re-apply your changes and save again
+                            st.session_state['update_base'] = conflict['server']
+                            st.session_state.pop('update_conflict')
+                            st.rerun()
             else:
                 st.warning("No courses available to update.")
         
@@ -488,9 +3463,7 @@ def main():
         elif operation == "Delete Course(s)":
             st.subheader("🗑️ Delete Course(s)")
             
-            df = fetch_all_courses()
-            
-            if not df.empty:
+            if count_courses() > 0:
                 # Delete mode selection
                 delete_mode = st.radio(
                     "Delete Mode:",
@@ -499,19 +3472,18 @@ def main():
                 )
                 
                 if delete_mode == "Delete Single Course":
-                    course_options = {f"ID: {row['row_id']} - {row['course_code']}": row['row_id'] 
-                                     for _, row in df.iterrows()}
+                    row_id = render_course_picker("Select Course to Delete:", "delete")
+                    course_details = fetch_course(row_id) if row_id is not None else None
                     
-                    selected_course = st.selectbox(
-                        "Select Course to Delete:",
-                        options=list(course_options.keys())
-                    )
-                    
-                    if selected_course:
-                        row_id = course_options[selected_course]
+                    if course_details:
+                        # Confirm deletes the version shown here, even if the course changes meanwhile
+                        if st.session_state.get('delete_base', {}).get('row_id') != row_id:
+                            st.session_state['delete_base'] = course_details
+                        course_details = st.session_state['delete_base']
+                        if 'delete_notice' in st.session_state:
+                            st.error(st.session_state.pop('delete_notice'))
                         
                         # Show course details
-                        course_details = df[df['row_id'] == row_id].iloc[0]
                         st.warning("⚠️ You are about to delete:")
                         st.json({
                             "ID": int(course_details['row_id']),
@@ -524,10 +3496,16 @@ def main():
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.button("🗑️ Confirm Delete", type="primary", use_container_width=True):
-                                success, message = delete_course(row_id)
+                                success, message, current = delete_course(row_id, int(course_details['row_version']))
                                 if success:
+                                    st.session_state.pop('delete_base', None)
                                     st.success(message)
                                     st.rerun()
+                                elif current is not None:
+                                    # Show the current values and let the user confirm again
+                                    st.session_state['delete_base'] = current
+                                    st.session_state['delete_notice'] = f"{message}. Nothing was deleted."
+                                    st.rerun()
                                 else:
                                     st.error(message)
                         with col2:
@@ -536,15 +3514,8 @@ def main():
                 
                 else:  # Delete Multiple Courses
                     st.markdown("Select courses to delete:")
-                    
-                    # Create checkboxes for each course
-                    selected_ids = []
-                    for _, row in df.iterrows():
-                        if st.checkbox(
-                            f"ID: {row['row_id']} - {row['course_code']} {row['course_name']} name,{row['course_credits']} credits,{row['sessions_per_week']} sessions/week)",
-                            key=f"delete_{row['row_id']}"
-                        ):
-                            selected_ids.append(row['row_id'])
+                    filters = render_course_filters("delete_many")
+                    selected_ids = render_course_selector("delete_many", filters)
                     
                     if selected_ids:
                         st.warning(f"⚠️ {len(selected_ids)} course(s) selected for deletion")
@@ -552,15 +3523,18 @@ def main():
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.button(f"🗑️ Delete {len(selected_ids)} Course(s)", type="primary", use_container_width=True):
-                                success, message = delete_multiple_courses(selected_ids)
+                                with st.spinner("Deleting courses..."):
+                                    success, message = delete_multiple_courses(sorted(selected_ids))
                                 if success:
+                                    clear_course_selection("delete_many")
                                     st.success(message)
                                     st.rerun()
                                 else:
                                     st.error(message)
                         with col2:
                             if st.button("❌ Cancel", use_container_width=True):
-                                st.info("Delete operation cancelled.")
+                                clear_course_selection("delete_many")
+                                st.rerun()
             else:
                 st.warning("No courses available to delete.")
 
@@ -568,15 +3542,20 @@ def main():
         # Import from Excel
         elif operation == "Import from Excel":
             st.subheader("📥 Import Courses from Excel")
+            render_import_jobs()
             
             # Download sample template
             st.markdown("### Step 1: Download Template")
             st.info("Download the sample Excel template to see the required format")
             
-            sample_excel = create_sample_excel()
+            template_variant = st.selectbox(
+                "Template",
+                list(TEMPLATE_VARIANTS),
+                format_func=TEMPLATE_VARIANTS.get
+            )
             st.download_button(
                 label="📥 Download Sample Excel Template",
-                data=sample_excel,
+                data=get_template(template_variant),
                 file_name="course_template.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 use_container_width=True
@@ -598,15 +3577,15 @@ def main():
             
             # File uploader
             uploaded_file = st.file_uploader(
-                "Choose an Excel file (.xlsx or .xls)",
-                type=['xlsx', 'xls'],
-                help="Upload your Excel file with course data"
+                "Choose an Excel or CSV file (.xlsx, .xls or .csv)",
+                type=['xlsx', 'xls', 'csv'],
+                help="Upload your Excel or CSV file with course data"
             )
             
             if uploaded_file is not None:
                 try:
-                    # Read the Excel file
-                    df = pd.read_excel(uploaded_file)
+                    # Read only the first rows; the import itself streams the file in chunks
+                    df = read_upload_preview(uploaded_file)
                     
                     # Validate the file
                     is_valid, message = validate_excel_file(df)
@@ -618,7 +3597,12 @@ def main():
                         
                         # Preview the data
                         st.markdown("### Preview Data")
-                        st.info(f"Found {len(df)} course(s) in the Excel file")
+                        estimated_rows = estimate_upload_rows(uploaded_file)
+                        if estimated_rows is not None:
+                            st.info(f"Found about {estimated_rows} course(s) in the file "
+                                    f"(showing the first {len(df)})")
+                        else:
+                            st.info(f"Showing the first {len(df)} course(s) in the file")
                         st.dataframe(df, use_container_width=True)
                         
                         # Import mode selection
@@ -627,54 +3611,86 @@ def main():
                         
                         import_mode = st.radio(
                             "How would you like to import?",
-                            ["Append to Existing Data", "Replace All Data"],
-                            help="Append adds to current data. Replace deletes all existing courses first."
+                            ["Append to Existing Data", "Merge by Course Code", "Replace All Data"],
+                            help="Append adds to current data. Merge inserts new course codes and updates "
+                                 "changed ones. Replace swaps in the imported courses for all existing ones."
                         )
+                        mode = {
+                            "Replace All Data": 'replace',
+                            "Merge by Course Code": 'upsert'
+                        }.get(import_mode, 'append')
+                        
+                        merge_blocked = import_mode == "Merge by Course Code" and not has_unique_course_codes()
+                        if merge_blocked:
+                            st.error("Merging needs unique course codes, but the table has duplicate codes. "
+                                     "Remove the duplicates, then retry the schema upgrade.")
+                            if st.button("🔁 Retry Schema Upgrade"):
+                                ensure_schema.clear()
+                                st.rerun()
                         
                         # Warning for replace mode
                         if import_mode == "Replace All Data":
-                            st.warning("⚠️ **WARNING**: This will delete ALL existing courses before importing!")
+                            st.warning("⚠️ **WARNING**: This will replace ALL existing courses once the import finishes!")
                             
                             # Show current count
-                            current_df = fetch_all_courses()
-                            if not current_df.empty:
-                                st.error(f"🗑️ {len(current_df)} existing course(s) will be deleted!")
+                            current_count = count_courses()
+                            if current_count > 0:
+                                st.error(f"🗑️ {current_count} existing course(s) will be deleted!")
+                        
+                        # Optional dry run: validate everything, for the chosen mode, before any write
+                        st.markdown("---")
+                        st.markdown("### Check Your File (Optional)")
+                        col1, col2, col3 = st.columns([1, 1, 2])
+                        with col1:
+                            report_format = st.selectbox(
+                                "Report format", ['csv', 'xlsx'], format_func=lambda f: EXPORT_FORMATS[f][0]
+                            )
+                        with col2:
+                            errors_only = st.checkbox("Only rows with errors")
+                        with col3:
+                            if st.button("🔎 Validate Without Importing", use_container_width=True):
+                                st.session_state.pop('validation_report', None)
+                                with st.spinner("Validating..."):
+                                    report = dry_run_import(
+                                        iter_upload_chunks(uploaded_file), mode, report_format, errors_only
+                                    )
+                                report['file_id'] = getattr(uploaded_file, 'file_id', uploaded_file.name)
+                                report['mode'] = mode
+                                st.session_state.validation_report = report
+                        
+                        report = st.session_state.get('validation_report')
+                        if (report and report['mode'] == mode
+                                and report['file_id'] == getattr(uploaded_file, 'file_id', uploaded_file.name)):
+                            if report['invalid']:
+                                st.warning(f"⚠️ {report['invalid']} of {report['rows']} row(s) would be skipped")
+                            else:
+                                st.success(f"✅ All {report['rows']} row(s) are valid")
+                            failing = {rule: count for rule, count in report['rule_counts'].items() if count}
+                            if failing:
+                                st.dataframe(
+                                    pd.DataFrame(list(failing.items()), columns=["Rule", "Rows"]),
+                                    hide_index=True
+                                )
+                            st.download_button(
+                                label="📥 Download Validation Report",
+                                data=report['data'],
+                                file_name=report['file_name'],
+                                mime=report['mime']
+                            )
                         
                         # Import button
                         st.markdown("---")
                         col1, col2 = st.columns(2)
                         
                         with col1:
-                            if st.button("📤 Import Courses", type="primary", use_container_width=True):
-                                with st.spinner("Importing courses..."):
-                                    mode = 'replace' if import_mode == "Replace All Data" else 'append'
-                                    success, success_count, error_count, errors = import_courses_from_excel(df, mode)
-                                    
-                                    if success:
-                                        if success_count > 0:
-                                            st.success(f"✅ Successfully imported {success_count} course(s)!")
-                                            st.balloons()
-                                        
-                                        if error_count > 0:
-                                            st.warning(f"⚠️ {error_count} row(s) had errors and were skipped")
-                                            with st.expander("View Errors"):
-                                                for error in errors[:20]:  # Show first 20 errors
-                                                    st.error(error)
-                                                if len(errors) > 20:
-                                                    st.info(f"... and {len(errors) - 20} more errors")
-                                        
-                                        # Refresh to show new data
-                                        st.session_state.refresh += 1
-                                        
-                                        # Show updated data
-                                        st.markdown("---")
-                                        st.markdown("### Updated Course List")
-                                        updated_df = fetch_all_courses()
-                                        st.dataframe(updated_df, use_container_width=True)
-                                    else:
-                                        st.error("❌ Import failed!")
-                                        for error in errors:
-                                            st.error(error)
+                            if st.button("📤 Import Courses", type="primary", use_container_width=True,
+                                         disabled=merge_blocked):
+                                # Run in the background: the job survives reruns and browser refreshes
+                                job = get_import_jobs().submit(uploaded_file, mode, estimated_rows)
+                                st.session_state.import_job = job.job_id
+                                st.query_params['job'] = job.job_id
+                                st.session_state.refresh += 1
+                                st.rerun()
                         
                         with col2:
                             if st.button("❌ Cancel", use_container_width=True):
@@ -683,30 +3699,67 @@ def main():
                                 st.rerun()
                 
                 except Exception as e:
-                    st.error(f"❌ Error reading Excel file: {str(e)}")
-                    st.info("Please make sure your file is a valid Excel file (.xlsx or .xls)")
+                    st.error(f"❌ Error reading file: {str(e)}")
+                    st.info("Please make sure your file is a valid Excel (.xlsx or .xls) or CSV file")
             
             # Show current data
             st.markdown("---")
             st.markdown("### Current Courses in Database")
-            df = fetch_all_courses()
-            if not df.empty:
-                st.dataframe(df, use_container_width=True, hide_index=True)
-            else:
+            if render_course_grid("import") == 0:
                 st.info("No courses in database yet")
                
+        record_timing(PAGES[operation], time.perf_counter() - page_started)
+        
         # Footer
+        sidebar_started = time.perf_counter()
         st.sidebar.markdown("---")
         st.sidebar.markdown("### Database Info")
-        st.sidebar.info(f"**Database:** {DB_CONFIG['database']}\n**Table:** tbl_courses")
+        st.sidebar.info(
+            f"**Database:** {get_backend().describe()} ({get_backend().label})\n"
+            f"**Table:** tbl_courses\n**Schema:** v{SCHEMA_VERSION}"
+        )
+        pool_stats = get_connection_pool().stats()
+        st.sidebar.caption(
+            f"Connections: {pool_stats['in_use']}/{pool_stats['pool_size']} in use, "
+            f"{pool_stats['checkouts']} checkouts, "
+            f"avg wait {pool_stats['avg_wait'] * 1000:.1f} ms"
+        )
+        if REPLICA_CONFIGS:
+            replicas = get_read_router().summary()
+            usable = sum(1 for lag, _ in replicas if lag is not None and lag <= REPLICA_ROUTING['max_lag'])
+            st.sidebar.caption(f"Read replicas: {usable}/{len(replicas)} within {REPLICA_ROUTING['max_lag']}s lag")
         
         # Show statistics
-        df = fetch_all_courses()
-        if not df.empty:
+        stats = fetch_course_stats()
+        if stats and stats['total']:
             st.sidebar.markdown("### Statistics")
-            st.sidebar.metric("Total Courses", len(df))
-            st.sidebar.metric("Avg Credits", f"{df['course_credits'].mean():.1f}")
-            st.sidebar.metric("Avg Sessions/Week", f"{df['sessions_per_week'].mean():.1f}")
+            st.sidebar.metric("Total Courses", stats['total'])
+            st.sidebar.metric("Avg Credits", f"{stats['avg_credits']:.1f}")
+            st.sidebar.metric("Avg Sessions/Week", f"{stats['avg_sessions']:.1f}")
+            with st.sidebar.expander("More Statistics"):
+                st.markdown(
+                    f"**Credits:** {stats['min_credits']}-{stats['max_credits']}  \n"
+                    f"**Sessions/Week:** {stats['min_sessions']}-{stats['max_sessions']}  \n"
+                    f"**Code Prefixes:** {len(stats['prefixes'])}"
+                )
+                st.caption("Courses by credits")
+                st.bar_chart(pd.Series(stats['credit_histogram'], name="Courses"))
+                st.caption("Courses by sessions/week")
+                st.bar_chart(pd.Series(stats['session_histogram'], name="Courses"))
+                if stats['prefixes']:
+                    st.caption("Top code prefixes")
+                    st.dataframe(
+                        pd.DataFrame(list(stats['prefixes'].items())[:10], columns=["Prefix", "Courses"]),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+        record_timing("page.sidebar", time.perf_counter() - sidebar_started)
+        
+        summary = metrics.finish_rerun(PAGES[operation])
+        if summary:
+            log_perf_event('rerun', **summary)
+        if METRICS_CONFIG['panel'] and st.sidebar.toggle("Show performance", key="show_performance"):
+            render_performance_panel(summary)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,382 @@
+"""
+Benchmark the course data layer and import path
+
+Generates synthetic course catalogues and uploads (with a controllable share of
+invalid rows), runs them through the same functions the app uses and reports
+latency percentiles, rows/sec and peak Python memory per operation. Results are
+written as JSON so runs can be compared with --compare.
+
+The benchmark replaces the contents of tbl_courses in the target database, so
+it refuses to run against the app's own database. With --backend sqlite the
+database is a scratch file and no server is needed:
+
+    python benchmark.py --backend sqlite --database /tmp/course_bench.db
+    python benchmark.py --database course_bench --sizes 1000 10000 100000
+    python benchmark.py --database course_bench --compare benchmark-before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import streamlit.logger
+
+import app
+
+# Outside `streamlit run` every cached call and st.* element logs a bare-mode warning
+streamlit.logger.set_log_level(logging.ERROR)
+
+OPERATIONS = ['fetch', 'search', 'import', 'upsert', 'export', 'delete']
+MAX_ROWS = 1_000_000
+
+CODE_PREFIXES = ['CS', 'MATH', 'PHYS', 'CHEM', 'BIO', 'ENG', 'HIST', 'ECON', 'PSY', 'ART']
+NAME_WORDS = [
+    'Introduction', 'Advanced', 'Applied', 'Theory', 'Methods', 'Systems', 'Data', 'Design',
+    'Analysis', 'Modern', 'Foundations', 'Topics', 'Principles', 'Computing', 'Networks',
+    'Statistics', 'Algebra', 'Mechanics', 'Ethics', 'History', 'Literature', 'Research',
+    'Seminar', 'Laboratory', 'Practice', 'Models', 'Structures', 'Security', 'Learning', 'Society'
+]
+# Kinds of invalid rows mixed into uploads, each tripping a different validation rule
+ERROR_KINDS = ['missing_code', 'name_too_long', 'credits_range', 'invalid_sessions', 'duplicate_code']
+
+class BenchmarkError(Exception):
+    """An operation under test reported failure, so its timings would be meaningless"""
+
+def generate_catalogue(rows, seed=0, start=0):
+    """Return a valid catalogue DataFrame with unique course codes (numbered from start)"""
+    if start + rows > MAX_ROWS:
+        raise ValueError(f"At most {MAX_ROWS} rows are supported (course codes are 10 characters)")
+    rng = np.random.default_rng(seed)
+    numbers = np.arange(start, start + rows)
+    prefixes = np.array(CODE_PREFIXES)[rng.integers(0, len(CODE_PREFIXES), rows)]
+    words = np.array(NAME_WORDS)[rng.integers(0, len(NAME_WORDS), (rows, 3))]
+    return pd.DataFrame({
+        'course_code': [f"{prefix}{number:06d}" for prefix, number in zip(prefixes, numbers)],
+        'course_name': [' '.join(name) for name in words],
+        'course_credits': rng.integers(1, 11, rows),
+        'sessions_per_week': rng.integers(1, 11, rows)
+    })
+
+def inject_errors(df, error_rate, seed=0):
+    """Return a copy of df with error_rate of its rows made invalid, spread over ERROR_KINDS"""
+    df = df.astype(object)
+    count = int(round(len(df) * error_rate))
+    if not count:
+        return df
+    rng = np.random.default_rng(seed + 1)
+    positions = rng.choice(len(df), size=count, replace=False)
+    kinds = rng.integers(0, len(ERROR_KINDS), count)
+    for position, kind in zip(positions, kinds):
+        kind = ERROR_KINDS[kind]
+        if kind == 'missing_code':
+            df.iat[position, 0] = None
+        elif kind == 'name_too_long':
+            df.iat[position, 1] = 'X' * (app.CONSTRAINTS['course_name']['max_length'] + 1)
+        elif kind == 'credits_range':
+            df.iat[position, 2] = app.CONSTRAINTS['course_credits']['max_value'] + 5
+        elif kind == 'invalid_sessions':
+            df.iat[position, 3] = 'many'
+        else:
+            df.iat[position, 0] = df.iat[(position + 1) % len(df), 0]
+    return df
+
+def write_upload(df, fmt):
+    """Serialise df the way a user upload arrives: a named in-memory file"""
+    buffer = BytesIO()
+    if fmt == 'csv':
+        buffer.write(df.to_csv(index=False).encode('utf-8'))
+    else:
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Courses")
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False):
+            sheet.append([None if pd.isna(value) else value for value in row])
+        workbook.save(buffer)
+    buffer.name = f"upload.{fmt}"
+    buffer.seek(0)
+    return buffer
+
+def run_import(upload, mode):
+    """Stream an upload through the app's import path; returns the rows it processed"""
+    chunks = app.iter_upload_chunks(upload)
+    try:
+        if mode == 'upsert':
+            success, counts, error_count, errors = app.upsert_courses_from_excel(chunks)
+            success_count = sum(counts.values())
+        else:
+            success, success_count, error_count, errors = app.import_courses_from_excel(chunks, mode)
+    finally:
+        chunks.close()
+    if not success:
+        raise BenchmarkError(f"{mode} import failed: {errors[:3]}")
+    return success_count + error_count
+
+def load_catalogue(df):
+    """Make df the whole contents of tbl_courses (untimed setup)"""
+    success, _, error_count, errors = app.import_courses_from_excel(df, 'replace')
+    if not success or error_count:
+        raise BenchmarkError(f"Could not load the catalogue: {errors[:3]}")
+
+def cold(loader, *args):
+    """Call a cached loader with its cache cleared so it always queries the database"""
+    loader.clear()
+    return loader(app.get_table_version().value, *args)
+
+def measure(run, setup=None, repeat=5):
+    """
+    Time repeat runs of run(state), where state comes from an untimed setup()
+    One extra run under tracemalloc measures peak Python memory; tracing slows
+    execution, so that run is left out of the timings
+    """
+    timings = []
+    queries_before = app.get_perf_metrics().snapshot()['counters']['queries']
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+    queries = (app.get_perf_metrics().snapshot()['counters']['queries'] - queries_before) / repeat
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, peak, queries
+
+def summarise(operation, case, rows, timings, peak, queries):
+    """Reduce raw timings to the figures stored in the results file"""
+    timings = np.array(timings)
+    p50 = float(np.percentile(timings, 50))
+    return {
+        'operation': operation,
+        'case': case,
+        'rows': rows,
+        'runs': len(timings),
+        'p50': p50,
+        'p95': float(np.percentile(timings, 95)),
+        'p99': float(np.percentile(timings, 99)),
+        'mean': float(timings.mean()),
+        'min': float(timings.min()),
+        'max': float(timings.max()),
+        'rows_per_sec': rows / p50 if p50 else None,
+        'queries_per_run': queries,
+        'peak_mib': peak / 2 ** 20
+    }
+
+def benchmark_size(size, operations, args):
+    """Run every selected operation against a catalogue of size rows; yields result dicts"""
+    catalogue = generate_catalogue(size, seed=args.seed)
+    upload_rows = inject_errors(catalogue, args.error_rate, seed=args.seed)
+    upload = write_upload(upload_rows, args.upload_format)
+    repeat = args.repeat
+
+    def case(operation, name, rows, run, setup=None):
+        timings, peak, queries = measure(run, setup, repeat)
+        return summarise(operation, name, rows, timings, peak, queries)
+
+    load_catalogue(catalogue)
+
+    if 'fetch' in operations:
+        yield case('fetch', 'all_courses', size, lambda _: app.load_all_courses())
+        page_size = app.PAGE_SIZES[0]
+        yield case('fetch', 'first_page', page_size, lambda _: cold(app.load_courses_page, 0, page_size))
+        last_page = max(size // page_size, 1)
+        yield case('fetch', 'last_page', page_size, lambda _: (
+            cold(app.load_courses_page, cold(app.load_page_anchor, last_page, page_size), page_size)
+        ))
+        # Catalogue refresh after a one-row write: applies the change log instead of re-reading
+        codes = iter(range(MAX_ROWS))
+        def add_one_course():
+            app.fetch_all_courses()
+            success, message = app.insert_course(f"DELTA{next(codes):05d}", "Delta refresh", 3, 2)
+            if not success:
+                raise BenchmarkError(message)
+        yield case('fetch', 'catalogue_delta', 1, lambda _: app.fetch_all_courses(), setup=add_one_course)
+        # What another server process pays to pick up the catalogue this one published
+        snapshot = app.get_course_catalogue().snapshot
+        if snapshot:
+            yield case('fetch', 'catalogue_snapshot', size, lambda _: snapshot.load()[0],
+                       setup=app.fetch_all_courses)
+
+    if 'search' in operations:
+        word = NAME_WORDS[0]
+        searches = {
+            'code_prefix': {'code_prefix': CODE_PREFIXES[1]},
+            'name_fulltext': {'name': word},
+            'name_substring': {'name': word[1:4].lower()},
+            'combined': {'query': word, 'credits': (3, 6), 'sessions': (1, 5)}
+        }
+        for name, filters in searches.items():
+            yield case('search', name, size, lambda _, filters=filters: (
+                cold(app.load_course_count, filters), cold(app.load_courses_page, 0, app.PICKER_LIMIT, filters)
+            ))
+
+    if 'import' in operations:
+        empty = catalogue.iloc[:0]
+        yield case('import', f'append_{args.upload_format}', size,
+                   lambda _: run_import(upload, 'append'), setup=lambda: load_catalogue(empty))
+        yield case('import', f'replace_{args.upload_format}', size, lambda _: run_import(upload, 'replace'))
+
+    if 'upsert' in operations:
+        # Half updates to existing codes, a quarter new codes, the rest unchanged
+        changed = catalogue.copy()
+        update = changed.index[:size // 2]
+        changed.loc[update, 'course_credits'] = changed.loc[update, 'course_credits'] % 10 + 1
+        new = generate_catalogue(size // 4, seed=args.seed + 2, start=size)
+        merged = pd.concat([changed.iloc[:size - len(new)], new], ignore_index=True)
+        merge_upload = write_upload(inject_errors(merged, args.error_rate, seed=args.seed), args.upload_format)
+        yield case('upsert', f'merge_{args.upload_format}', size,
+                   lambda _: run_import(merge_upload, 'upsert'), setup=lambda: load_catalogue(catalogue))
+        load_catalogue(catalogue)
+
+    if 'export' in operations:
+        formats = ['csv', 'xlsx'] + (['parquet'] if app.pq is not None else [])
+        for fmt in formats:
+            if fmt == 'xlsx' and size > args.max_xlsx_rows:
+                continue
+            yield case('export', fmt, size, lambda _, fmt=fmt: export_and_discard(fmt))
+
+    if 'delete' in operations:
+        def pick_rows():
+            load_catalogue(catalogue)
+            row_ids = cold(app.load_matching_row_ids)
+            rng = np.random.default_rng(args.seed)
+            return rng.choice(row_ids, size=max(len(row_ids) // 10, 1), replace=False).tolist()
+
+        def delete(row_ids):
+            success, message = app.delete_multiple_courses(row_ids)
+            if not success:
+                raise BenchmarkError(message)
+
+        yield case('delete', 'bulk_10pct', max(size // 10, 1), delete, setup=pick_rows)
+
+def export_and_discard(fmt):
+    """Build a full export in fmt and drop it"""
+    return app.export_courses(fmt)['rows']
+
+def git_revision():
+    """Short commit hash of the working tree, if it is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result, baseline=None):
+    """Print one result line, with the p50 change against baseline when there is one"""
+    line = (f"{result['operation']:<8} {result['case']:<18} {result['rows']:>9} rows  "
+            f"p50 {result['p50'] * 1000:9.1f} ms  p95 {result['p95'] * 1000:9.1f} ms  "
+            f"{result['rows_per_sec'] or 0:>12,.0f} rows/s  {result['peak_mib']:7.1f} MiB")
+    if baseline:
+        before = baseline.get((result['operation'], result['case'], result['rows']))
+        if before and before['p50']:
+            line += f"  ({(result['p50'] / before['p50'] - 1) * 100:+.1f}% p50)"
+    print(line, flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the course data layer and import path")
+    parser.add_argument('--backend', choices=list(app.BACKENDS), default=app.STORAGE_BACKEND,
+                        help="Storage backend to benchmark (default: the app's STORAGE_BACKEND)")
+    parser.add_argument('--database', required=True,
+                        help="Scratch database (a file path for sqlite); its tbl_courses is overwritten")
+    parser.add_argument('--host', help="Database host (default: app DB_CONFIG)")
+    parser.add_argument('--user', help="Database user (default: app DB_CONFIG)")
+    parser.add_argument('--password', help="Database password (default: app DB_CONFIG)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help=f"Catalogue sizes in rows (up to {MAX_ROWS})")
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case")
+    parser.add_argument('--error-rate', type=float, default=0.01,
+                        help="Share of upload rows made invalid (0-1)")
+    parser.add_argument('--upload-format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--max-xlsx-rows', type=int, default=100000,
+                        help="Skip .xlsx exports above this catalogue size")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Results file (default: benchmark-<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier results file to show p50 changes against")
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        app_database = os.path.abspath(app.SQLITE_CONFIG['path']) == os.path.abspath(args.database)
+    else:
+        app_database = args.database == app.DB_CONFIG['database']
+    if app_database:
+        parser.error(f"refusing to overwrite the app database '{args.database}'; pick a scratch database")
+    if any(size < 1 or size > MAX_ROWS for size in args.sizes):
+        parser.error(f"sizes must be between 1 and {MAX_ROWS}")
+    if not 0 <= args.error_rate < 1:
+        parser.error("--error-rate must be in [0, 1)")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Point the app at the scratch database before its pool or schema is first used
+    app.STORAGE_BACKEND = args.backend
+    app.SNAPSHOT_CONFIG['path'] = os.path.join(tempfile.gettempdir(), f'course_bench_snapshot_{args.backend}.arrow')
+    if args.backend == 'sqlite':
+        app.SQLITE_CONFIG['path'] = args.database
+    else:
+        app.DB_CONFIG['database'] = args.database
+        for key in ('host', 'user', 'password'):
+            if getattr(args, key) is not None:
+                app.DB_CONFIG[key] = getattr(args, key)
+    if not app.create_database_and_table():
+        sys.exit("Could not connect to the benchmark database")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['operation'], r['case'], r['rows']): r for r in json.load(f)['results']}
+
+    started = datetime.now()
+    results = []
+    for size in args.sizes:
+        print(f"\n== {size} rows ==", flush=True)
+        for result in benchmark_size(size, args.operations, args):
+            result['catalogue_rows'] = size
+            results.append(result)
+            print_result(result, baseline)
+
+    output = args.output or f"benchmark-{started:%Y%m%d-%H%M%S}.json"
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'started': started.isoformat(timespec='seconds'),
+                'duration': (datetime.now() - started).total_seconds(),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pandas': pd.__version__,
+                'backend': args.backend,
+                'database': args.database,
+                'sizes': args.sizes,
+                'repeat': args.repeat,
+                'error_rate': args.error_rate,
+                'upload_format': args.upload_format,
+                'seed': args.seed,
+                'import_config': app.IMPORT_CONFIG,
+                'pool_config': app.POOL_CONFIG
+            },
+            'results': results
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
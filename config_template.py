@@ -1,6 +1,9 @@
 # Database Configuration Template
 # Copy this file to config.py and update with your actual credentials
 
+# Storage Backend: 'mysql' (DB_CONFIG) or 'sqlite' (embedded file, SQLITE_CONFIG)
+STORAGE_BACKEND = 'mysql'
+
 DB_CONFIG = {
     'host': 'https://sv51.byethost51.org:2083/cpsess5207811907/3rdparty/phpMyAdmin/index.php?route=/database/structure&db=upendral_classicmodels',           # MySQL server hostname or IP
     'user': 'root',                # MySQL username
@@ -10,6 +13,66 @@ DB_CONFIG = {
     'raise_on_warnings': True      # Raise exceptions on MySQL warnings
 }
 
+# Embedded SQLite Settings (STORAGE_BACKEND = 'sqlite')
+SQLITE_CONFIG = {
+    'path': 'courses.db',          # Database file, created on first use
+    'busy_timeout': 5,             # Seconds a writer waits for another writer's lock
+    'synchronous': 'NORMAL'        # WAL + NORMAL: crash-safe, may lose the last commits on power loss
+}
+
+# Connection Pool Settings (one pool per server process, shared by all sessions)
+POOL_CONFIG = {
+    'pool_size': 5,                # Maximum number of open connections
+    'checkout_timeout': 10,        # Seconds to wait for a free connection
+    'health_check_interval': 30    # Ping connections idle longer than this (seconds)
+}
+
+# Read Replicas (each entry overrides DB_CONFIG keys, e.g. {'host': 'replica-1'};
+# MySQL lag checks need the REPLICATION CLIENT privilege)
+REPLICA_CONFIGS = []
+
+# Read Routing across REPLICA_CONFIGS
+REPLICA_ROUTING = {
+    'max_lag': 5,                  # Seconds behind the primary before a replica is skipped
+    'status_interval': 1           # Seconds between lag/version checks of each replica
+}
+
+# Async Data Layer (reads and imports get separate lanes; keep their sum within pool_size)
+ASYNC_CONFIG = {
+    'read_concurrency': 4,         # Reads running at once across all sessions
+    'write_concurrency': 1         # Imports writing at once
+}
+
+# Change Log (every write is also recorded in tbl_course_changes)
+CHANGE_LOG_CONFIG = {
+    'poll_interval': 2,            # Seconds between checks for changes from other server processes
+    'max_delta': 5000,             # Bigger backlogs reload the cached catalogue in full
+    'overlap': 100                 # Entries re-read per refresh (concurrent commits may land out of order)
+}
+
+# Catalogue Snapshot (Arrow IPC file shared by the server processes on one host; needs pyarrow)
+SNAPSHOT_CONFIG = {
+    'path': 'course_snapshot.arrow',  # Replaced atomically per table version (None = off)
+    'save_interval': 10               # Seconds between rewrites; writes in between share one save
+}
+
+# Import Settings
+IMPORT_CONFIG = {
+    'batch_size': 1000,            # Rows sent per multi-row INSERT
+    'chunk_size': 5000,            # Rows read from the upload and validated at a time
+    'preview_rows': 100,           # Rows shown in the upload preview
+    'max_errors': 1000,            # Error messages kept per import (all errors are still counted)
+    'workers': 1                   # Imports run at the same time; further jobs wait in the queue
+}
+
+# Performance Instrumentation
+METRICS_CONFIG = {
+    'panel': True,                 # Offer the sidebar Performance panel
+    'log_json': False,             # Log a JSON summary of every rerun and import
+    'host': '127.0.0.1',           # Interface the metrics endpoint listens on ('' = all)
+    'port': None                   # Serve Prometheus text at /metrics on this port (None = off)
+}
+
 # Application Settings
 APP_CONFIG = {
     'page_title': 'Course Management System',
@@ -27,6 +90,10 @@ CONSTRAINTS = {
         'max_length': 10,
         'required': True
     },
+    'course_name': {
+        'max_length': 50,
+        'required': True
+    },
     'course_credits': {
         'min_value': 1,
         'max_value': 10,